@@ -0,0 +1,222 @@
+import argparse
+import json
+import logging
+import re
+import sys
+import time
+from datetime import datetime
+
+from config import *
+from instrumentation import configure_logging
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+
+def parse_time(value):
+    """Parse '7d', '12h' (that long ago) or an ISO date/datetime into a Unix timestamp
+
+    Raises argparse.ArgumentTypeError for anything else, so it can serve as an argparse type.
+    """
+    relative = re.fullmatch(r'(\d+)\s*([hd])', value.strip().lower())
+    if relative:
+        amount, unit = int(relative.group(1)), relative.group(2)
+        return time.time() - amount * (3600 if unit == 'h' else 86400)
+    try:
+        return datetime.fromisoformat(value.strip()).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid time {value!r}: use an ISO date such as 2026-01-31, or an age such as 7d or 12h")
+
+
+def _match_expression(query):
+    """Quote each search term so user input never breaks FTS5 query syntax; terms are ANDed"""
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+class ArticleArchive(SQLiteStore):
+    """SQLite archive of accepted articles with an FTS5 full-text index over title, summary and topic
+
+    Every article a digest run accepts is stored with the time it was found and, once
+    delivered, the time it was sent, so past and ad-hoc digests can be rebuilt locally.
+    """
+
+    def __init__(self, path=ARCHIVE_FILE):
+        super().__init__(path)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS articles (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                topic TEXT NOT NULL,
+                title TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                relevance_score REAL,
+                alternates TEXT,
+                found_at REAL NOT NULL,
+                sent_at REAL,
+                UNIQUE (url, topic)
+            );
+            CREATE INDEX IF NOT EXISTS articles_found_at ON articles (found_at);
+            CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+                title, summary, topic, content='articles', content_rowid='id'
+            );
+            -- Keep the external-content index in step with the articles table
+            CREATE TRIGGER IF NOT EXISTS articles_ai AFTER INSERT ON articles BEGIN
+                INSERT INTO articles_fts (rowid, title, summary, topic)
+                VALUES (new.id, new.title, new.summary, new.topic);
+            END;
+            CREATE TRIGGER IF NOT EXISTS articles_ad AFTER DELETE ON articles BEGIN
+                INSERT INTO articles_fts (articles_fts, rowid, title, summary, topic)
+                VALUES ('delete', old.id, old.title, old.summary, old.topic);
+            END;
+            CREATE TRIGGER IF NOT EXISTS articles_au AFTER UPDATE OF title, summary, topic ON articles BEGIN
+                INSERT INTO articles_fts (articles_fts, rowid, title, summary, topic)
+                VALUES ('delete', old.id, old.title, old.summary, old.topic);
+                INSERT INTO articles_fts (rowid, title, summary, topic)
+                VALUES (new.id, new.title, new.summary, new.topic);
+            END;
+        """)
+
+    def add(self, articles, found_at=None):
+        """Store accepted articles; an article already archived under the same topic is kept as is"""
+        if not articles:
+            return
+        found_at = found_at or time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO articles (url, topic, title, summary, relevance_score, alternates, found_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(article['url'], article['topic'], str(article['title']), str(article['summary']),
+                  article.get('relevance_score'), json.dumps(article.get('alternates') or []), found_at)
+                 for article in articles]
+            )
+            self._conn.execute('COMMIT')
+
+    def mark_sent(self, urls, sent_at=None):
+        """Record that the articles with these URLs went out in a digest"""
+        if not urls:
+            return
+        sent_at = sent_at or time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany('UPDATE articles SET sent_at = ? WHERE url = ? AND sent_at IS NULL',
+                                   [(sent_at, url) for url in urls])
+            self._conn.execute('COMMIT')
+
+    def search(self, query=None, topics=None, since=None, until=None, sent_only=False, limit=ARCHIVE_QUERY_LIMIT):
+        """Return archived articles matching every given filter
+
+        query is matched against title, summary and topic, and results are ranked by relevance
+        to it; without a query the newest articles come first. Articles are dicts in the
+        pipeline's article format plus found_at and sent_at timestamps.
+        """
+        clauses = []
+        args = []
+        if query:
+            expression = _match_expression(query)
+            if not expression:
+                return []
+        if topics:
+            clauses.append(f"articles.topic COLLATE NOCASE IN ({', '.join('?' for _ in topics)})")
+            args.extend(topics)
+        if since is not None:
+            clauses.append('articles.found_at >= ?')
+            args.append(since)
+        if until is not None:
+            clauses.append('articles.found_at < ?')
+            args.append(until)
+        if sent_only:
+            clauses.append('articles.sent_at IS NOT NULL')
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+        if query:
+            # bm25 is lower for better matches
+            sql = (f'SELECT articles.* FROM articles '
+                   f'JOIN articles_fts ON articles_fts.rowid = articles.id AND articles_fts MATCH ? '
+                   f'{where} ORDER BY bm25(articles_fts) LIMIT ?')
+            args = [expression] + args + [limit]
+        else:
+            sql = f'SELECT articles.* FROM articles {where} ORDER BY found_at DESC LIMIT ?'
+            args.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+
+        articles = []
+        for _, url, topic, title, summary, score, alternates, found_at, sent_at in rows:
+            article = {'title': title, 'url': url, 'summary': summary, 'topic': topic,
+                       'relevance_score': score, 'found_at': found_at, 'sent_at': sent_at}
+            alternates = json.loads(alternates or '[]')
+            if alternates:
+                article['alternates'] = alternates
+            articles.append(article)
+        return articles
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM articles').fetchone()[0]
+
+
+def group_by_topic(articles):
+    """Order articles so each topic's articles are together, topics in order of their best article"""
+    order = {}
+    for article in articles:
+        order.setdefault(article['topic'], len(order))
+    return sorted(articles, key=lambda article: order[article['topic']])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Build a digest from archived articles without API calls.')
+    parser.add_argument('query', nargs='?', help='keywords to match in titles, summaries and topics')
+    parser.add_argument('--topic', action='append', dest='topics', help='only this topic (repeatable)')
+    parser.add_argument('--since', type=parse_time, help="only articles found after this: an ISO date/time or '7d', '12h'")
+    parser.add_argument('--until', type=parse_time, help="only articles found before this: an ISO date/time or '7d', '12h'")
+    parser.add_argument('--sent', action='store_true', help='only articles that were delivered in a digest')
+    parser.add_argument('--limit', type=int, default=ARCHIVE_QUERY_LIMIT)
+    parser.add_argument('--html', metavar='FILE', help='also write the HTML digest to FILE')
+    parser.add_argument('--json', action='store_true', help='print matching articles as JSON instead of a digest')
+    parser.add_argument('--send-to', metavar='EMAIL', help='email the digest to this address')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging()
+
+    started = time.perf_counter()
+    archive = ArticleArchive()
+    articles = group_by_topic(archive.search(
+        args.query, topics=args.topics,
+        since=args.since, until=args.until,
+        sent_only=args.sent, limit=args.limit
+    ))
+    logger.info("Found %s archived articles in %.1f ms", len(articles), (time.perf_counter() - started) * 1000)
+
+    if args.json:
+        json.dump(articles, sys.stdout, indent=2)
+        print()
+        return
+    if not articles:
+        print("No archived articles match.", file=sys.stderr)
+        return
+
+    # Imported here so local queries do not pay for the pipeline's imports
+    from digest_renderer import DigestRenderer
+    html_content, plain_content = DigestRenderer().render(articles)
+    if args.html:
+        with open(args.html, 'w') as f:
+            f.write(html_content)
+    if args.send_to:
+        from news_aggregator import NewsAggregator
+        from subscribers import SubscriberRegistry
+        aggregator = NewsAggregator(subscribers=SubscriberRegistry([]), lazy_gmail=True)
+        aggregator.recipient_email = args.send_to
+        if not aggregator.send_digest(articles):
+            raise SystemExit(1)
+        return
+    print(plain_content, end='')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Offline end-to-end benchmark for the digest pipeline.
+
+Run from the project root:
+
+    python -m benchmarks.bench_pipeline --sizes 10 100 1000
+
+Each topic-set size runs in its own process against local stand-ins for the
+Perplexity API, article pages and Gmail (see benchmarks/stub_servers.py), so
+no credentials or API credits are needed and peak RSS is measured per size.
+The report lists wall time, throughput, API calls, peak RSS and per-stage
+latency percentiles. Use --output to append results as JSON lines and compare
+runs over time.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+STAGES = ['search', 'verify', 'relevance', 'fetch', 'summary', 'structured', 'render', 'send']
+WORDS = ['quantum', 'battery', 'fintech', 'robotics', 'semiconductor', 'climate', 'biotech',
+         'logistics', 'payments', 'satellite', 'gaming', 'insurance', 'retail', 'energy', 'security']
+
+
+def synthetic_topics(count):
+    return [f"{WORDS[i % len(WORDS)]} {WORDS[(i * 7 + 3) % len(WORDS)]} {i}" for i in range(count)]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help='topic-set sizes to run')
+    parser.add_argument('--subscribers', type=int, default=10, help='subscribers sharing the topic set')
+    parser.add_argument('--mode', default='multi_stage', choices=['multi_stage', 'structured'])
+    parser.add_argument('--concurrency', type=int, default=16, help='MAX_CONCURRENT_TOPICS')
+    parser.add_argument('--max-rps', type=float, default=0, help='PERPLEXITY_MAX_RPS (0 = unlimited)')
+    parser.add_argument('--latency', type=float, default=0.05, help='mean stand-in latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.02, help='uniform latency jitter in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 429/503')
+    parser.add_argument('--content-bytes', type=int, default=2000, help='size of completion and page bodies')
+    parser.add_argument('--results', type=int, default=3, help='search results per topic')
+    parser.add_argument('--duplicate-rate', type=float, default=0.0,
+                        help='fraction of article pages that repeat their subject\'s lead story')
+    parser.add_argument('--seed', type=int, default=0, help='seed for which results are on topic or duplicated')
+    # Every stand-in page is served from one host, so the per-host cap needs to be raised
+    parser.add_argument('--per-host', type=int, default=16, help='PAGE_FETCH_PER_HOST')
+    parser.add_argument('--no-page-fetch', action='store_true', help='disable article page fetching')
+    parser.add_argument('--output', help='append results as JSON lines to this file')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def run_single(args):
+    """Run one digest in this process and return its measurements"""
+    # config.py reads the environment at import time, so everything is set up first
+    data_dir = tempfile.mkdtemp(prefix='newsletter-bench-')
+    # The stand-in pages are served from localhost, so that is the only trusted source
+    sources_file = os.path.join(data_dir, 'sources.json')
+    with open(sources_file, 'w') as f:
+        json.dump({'allow': ['127.0.0.1']}, f)
+    os.environ.update({
+        'NEWS_DATA_DIR': data_dir,
+        'SOURCES_FILE': sources_file,
+        'PERPLEXITY_API_KEY': 'standin-key',
+        'EMAIL_SENDER': 'bench@example.com',
+        'MAX_CONCURRENT_TOPICS': str(args.concurrency),
+        'PERPLEXITY_MAX_RPS': str(args.max_rps),
+        'PIPELINE_MODE': args.mode,
+        'PAGE_FETCH_ENABLED': 'false' if args.no_page_fetch else 'true',
+        'PAGE_FETCH_PER_HOST': str(args.per_host),
+        'METRICS_FILE': '',
+        'SUBSCRIBERS_FILE': '',
+        'LOG_LEVEL': os.environ.get('LOG_LEVEL', 'WARNING')
+    })
+
+    from benchmarks.stub_servers import (StandInConfig, gmail_service, start_gmail, start_pages,
+                                         start_perplexity)
+    config = StandInConfig(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                           content_bytes=args.content_bytes, results_per_search=args.results,
+                           duplicate_rate=args.duplicate_rate, seed=args.seed)
+    pages = start_pages(config)
+    perplexity = start_perplexity(config, pages.url)
+    gmail = start_gmail(config)
+    os.environ['PERPLEXITY_API_BASE'] = perplexity.url
+
+    from instrumentation import configure_logging
+    from news_aggregator import NewsAggregator
+    from subscribers import Subscriber, SubscriberRegistry
+    configure_logging(os.environ['LOG_LEVEL'])
+
+    topics = synthetic_topics(args.single)
+    subscribers = SubscriberRegistry([
+        Subscriber(f"reader{i}@example.com", topics[i::args.subscribers]) for i in range(args.subscribers)
+    ])
+    aggregator = NewsAggregator(gmail_service=gmail_service(gmail.url), subscribers=subscribers)
+
+    started = time.perf_counter()
+    aggregator.run_daily_digest()
+    elapsed = time.perf_counter() - started
+
+    summary = aggregator.metrics.summary()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak_rss *= 1024  # ru_maxrss is reported in kilobytes on Linux
+    result = {
+        'topics': args.single,
+        'mode': args.mode,
+        'concurrency': args.concurrency,
+        'latency': args.latency,
+        'error_rate': args.error_rate,
+        'wall_seconds': elapsed,
+        'topics_per_second': args.single / elapsed if elapsed else 0.0,
+        'articles': summary['counters'].get('articles', 0),
+        'emails_sent': summary['counters'].get('emails_sent', 0),
+        'perplexity_requests': perplexity.requests_served,
+        'page_requests': pages.requests_served,
+        'gmail_messages': gmail.requests_served,
+        'peak_rss_bytes': peak_rss,
+        'stages': summary['stages']
+    }
+    for server in (perplexity, pages, gmail):
+        server.stop()
+    return result
+
+
+def print_report(results):
+    print(f"{'topics':>7} {'wall s':>8} {'topics/s':>9} {'articles':>9} {'API calls':>10} {'peak MB':>8}")
+    for result in results:
+        print(f"{result['topics']:>7} {result['wall_seconds']:>8.2f} {result['topics_per_second']:>9.1f} "
+              f"{result['articles']:>9} {result['perplexity_requests']:>10} "
+              f"{result['peak_rss_bytes'] / 1024 / 1024:>8.1f}")
+    print()
+    print(f"{'topics':>7} {'stage':>11} {'spans':>7} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'total s':>8}")
+    for result in results:
+        for stage in STAGES:
+            stats = result['stages'].get(stage)
+            if not stats or not stats['count']:
+                continue
+            print(f"{result['topics']:>7} {stage:>11} {stats['count']:>7} {stats['p50_seconds'] * 1000:>8.1f} "
+                  f"{stats['p95_seconds'] * 1000:>8.1f} {stats['max_seconds'] * 1000:>8.1f} "
+                  f"{stats['total_seconds']:>8.2f}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.single is not None:
+        print(json.dumps(run_single(args)))
+        return
+
+    passthrough = [arg for arg in (argv if argv is not None else sys.argv[1:])]
+    results = []
+    for size in args.sizes:
+        print(f"Running {size} topics...", file=sys.stderr)
+        child = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_pipeline', *passthrough, '--single', str(size)],
+            capture_output=True, text=True
+        )
+        if child.returncode != 0:
+            print(child.stderr, file=sys.stderr)
+            raise SystemExit(f"Benchmark for {size} topics failed")
+        results.append(json.loads(child.stdout.strip().splitlines()[-1]))
+
+    print_report(results)
+    if args.output:
+        with open(args.output, 'a') as f:
+            for result in results:
+                f.write(json.dumps(dict(result, recorded_at=time.time()), sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    main()
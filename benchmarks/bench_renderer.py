@@ -0,0 +1,84 @@
+"""Micro-benchmark for digest rendering.
+
+Run from the project root:
+
+    python -m benchmarks.bench_renderer
+
+Reports the time to render digests of increasing size with DigestRenderer and
+with the previous string-concatenation approach. Time per article should stay
+flat as the article count grows.
+
+Two kinds of articles are rendered: "plain", where one title and URL in ten
+has a character that needs HTML escaping, and "markup", where every title and
+URL has some. The previous approach escaped nothing, so on "markup" articles
+the renderer pays for escaping that the baseline skips.
+"""
+import time
+
+from digest_renderer import DigestRenderer, HTML_FOOTER, HTML_HEADER, PLAIN_HEADER
+
+SIZES = [100, 1000, 10000, 50000]
+TOPICS = 50
+
+
+def make_articles(count, markup=True):
+    def needs_escaping(i):
+        return markup or i % 10 == 0
+    return [{
+        'topic': f'topic {i % TOPICS}',
+        'title': f'Article {i} <headline> & more' if needs_escaping(i) else f'Article {i} headline and more',
+        'summary': f'Summary {i}. ' * 20,
+        'url': f'https://example.com/news/{i}?a=1&b=2' if needs_escaping(i) else f'https://example.com/news/{i}'
+    } for i in sorted(range(count), key=lambda i: i % TOPICS)]
+
+
+def render_concatenated(articles):
+    """The original send_digest rendering loop, kept as a baseline"""
+    html_content = HTML_HEADER
+    for article in articles:
+        html_content += f"""
+            <div class="article">
+                <div class="topic">Topic: {article['topic']}</div>
+                <div class="title">{article['title']}</div>
+                <div class="summary">{article['summary']}</div>
+                <a href="{article['url']}" class="source">Source</a>
+            </div>
+            """
+    html_content += HTML_FOOTER
+    plain_content = PLAIN_HEADER
+    for article in articles:
+        plain_content += f"Topic: {article['topic']}\n"
+        plain_content += f"Title: {article['title']}\n"
+        plain_content += f"Summary: {article['summary']}\n"
+        plain_content += f"Source: {article['url']}\n\n"
+        plain_content += "-" * 80 + "\n\n"
+    return html_content, plain_content
+
+
+def timed(func, *args, repeat=10):
+    """Best of repeat runs in CPU seconds, which other load on the machine disturbs less than wall time"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.process_time()
+        func(*args)
+        best = min(best, time.process_time() - started)
+    return best
+
+
+def main():
+    print(f"{'text':>7} {'articles':>9} {'concat ms':>10} {'render ms':>10} {'cached ms':>10} {'us/article':>11}")
+    for markup in (False, True):
+        for size in SIZES:
+            articles = make_articles(size, markup)
+            baseline = timed(render_concatenated, articles)
+            # A fresh renderer each repeat measures cold rendering without the section cache
+            cold = timed(lambda: DigestRenderer(cache_size=TOPICS).render(articles))
+            renderer = DigestRenderer(cache_size=TOPICS)
+            renderer.render(articles)
+            warm = timed(renderer.render, articles)
+            print(f"{'markup' if markup else 'plain':>7} {size:>9} {baseline * 1000:>10.1f} {cold * 1000:>10.1f} "
+                  f"{warm * 1000:>10.1f} {cold / size * 1e6:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+"""Local HTTP stand-ins for the Perplexity chat-completions API, article pages and Gmail.
+
+The stand-ins let the pipeline run end to end without network access or API
+credits. Latency, error rate and response size are configurable so benchmark
+runs can model slow or flaky upstreams. Which results are on topic, which pages
+repeat a story and every URL depend only on the seed, so runs with the same seed
+see the same workload.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import quote, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Share of a streamed completion's latency spent before its first event, and the number of events
+FIRST_EVENT_SHARE = 0.2
+STREAM_EVENTS = 8
+
+STORY_WORDS = ("markets investors quarter revenue growth deal merger startup funding round chip "
+               "supply chain regulators court ruling launch product shares rally slump forecast "
+               "earnings outlook policy election energy prices demand shipping labor union strike "
+               "acquisition valuation platform users security breach model research lab").split()
+
+FILLER = ("Analysts said the development could reshape the sector over the coming quarters, "
+          "while regulators and investors continue to watch closely. ")
+
+
+def _digest(*key):
+    return hashlib.blake2b(repr(key).encode('utf-8'), digest_size=8).digest()
+
+
+def _draw(*key):
+    """Uniform float in [0, 1) that is the same for the same key in every thread and run"""
+    return int.from_bytes(_digest(*key), 'big') / 2 ** 64
+
+
+class StandInConfig:
+    """Behaviour shared by every stand-in endpoint"""
+
+    def __init__(self, latency=0.05, jitter=0.02, error_rate=0.0, content_bytes=2000,
+                 results_per_search=3, on_topic_rate=0.7, duplicate_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.content_bytes = content_bytes
+        self.results_per_search = results_per_search
+        self.on_topic_rate = on_topic_rate
+        self.duplicate_rate = duplicate_rate
+        self.seed = seed
+        # Only latency and failures are drawn from the shared generator, since the
+        # order threads draw in varies between runs
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample_latency(self):
+        with self.lock:
+            return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def delay(self):
+        time.sleep(self.sample_latency())
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def chance(self, rate, *key):
+        """True with probability rate; with a key, the outcome depends only on the seed and key"""
+        if key:
+            return _draw(self.seed, *key) < rate
+        with self.lock:
+            return self.random.random() < rate
+
+    def page_id(self, topic, index):
+        """Stable identifier for the page behind a topic's index-th search result"""
+        return _digest(self.seed, topic, index).hex()
+
+
+class _StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Large benchmark runs open many keep-alive connections at once
+    request_queue_size = 512
+
+    def __init__(self, handler, config):
+        super().__init__(('127.0.0.1', 0), handler)
+        self.config = config
+        self.requests_served = 0
+        self.counter_lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def count(self):
+        with self.counter_lock:
+            self.requests_served += 1
+            return self.requests_served
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body, content_type='application/json', headers=None):
+        data = body if isinstance(body, bytes) else body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _maybe_fail(self):
+        """Reply with a retryable error according to the configured error rate"""
+        if self.server.config.should_fail():
+            status = 429 if self.server.config.chance(0.5) else 503
+            self._reply(status, json.dumps({'error': 'stand-in failure'}), headers={'Retry-After': '0'})
+            return True
+        return False
+
+
+def _story(seed, size):
+    """Pseudo-random article text that is the same for the same seed and distinct otherwise"""
+    words = random.Random(seed).choices(STORY_WORDS, k=max(1, size // 7))
+    return ' '.join(words)[:size]
+
+
+def _padded(text, size):
+    if len(text) >= size:
+        return text[:size]
+    return text + FILLER * ((size - len(text)) // len(FILLER) + 1)
+
+
+class PerplexityHandler(_Handler):
+    """Answers chat-completion prompts with synthetic but well-formed responses"""
+
+    def do_POST(self):
+        payload = json.loads(self._read_body() or b'{}')
+        self.server.count()
+        if payload.get('stream'):
+            self._stream(payload)
+            return
+        self.server.config.delay()
+        if self._maybe_fail():
+            return
+        prompt = payload['messages'][-1]['content']
+        self._reply(200, json.dumps(self._complete(prompt, payload)))
+
+    def _stream(self, payload):
+        """Reply with server-sent events, spreading the latency over the stream like a real model"""
+        latency = self.server.config.sample_latency()
+        time.sleep(latency * FIRST_EVENT_SHARE)
+        if self._maybe_fail():
+            return
+        response = self._complete(payload['messages'][-1]['content'], payload)
+        content = response['choices'][0]['message']['content']
+        size = -(-len(content) // STREAM_EVENTS) or 1
+        pieces = [content[i:i + size] for i in range(0, len(content), size)] or ['']
+
+        first = {'id': response['id'], 'model': response['model'],
+                 'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': pieces[0]}}]}
+        if 'search_results' in response:
+            first['search_results'] = response['search_results']
+        events = [first] + [{'choices': [{'index': 0, 'delta': {'content': piece}}]} for piece in pieces[1:]]
+        events.append({'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}], 'usage': response['usage']})
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        pause = latency * (1 - FIRST_EVENT_SHARE) / max(1, len(events) - 1)
+        try:
+            for index, event in enumerate(events):
+                if index:
+                    time.sleep(pause)
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client cancelled the rest of the completion
+
+    def _complete(self, prompt, payload):
+        config = self.server.config
+        topic_match = re.search(r' hours about (.+?)\.?$', prompt)
+        if 'response_format' in payload:
+            topics = re.findall(r'^- (.+)$', prompt, re.MULTILINE)
+            content = json.dumps({'articles': [{
+                'topic': topic,
+                'title': f"{topic.title()} story {i}",
+                'url': f"{self.server.pages_url}/{config.page_id(topic, i)}",
+                'summary': f"A short summary about {topic}.",
+                'relevance_score': 0.9,
+                'key_themes': [topic]
+            } for topic in topics for i in range(config.results_per_search)]})
+            results = []
+        elif topic_match or prompt.startswith('Find recent news'):
+            topic = topic_match.group(1) if topic_match else 'news'
+            subject = topic if config.chance(config.on_topic_rate, 'on_topic', topic) else 'municipal water infrastructure'
+            content = _padded(f"Title: Latest on {subject}\n{subject.capitalize()} was in the news today. ", config.content_bytes)
+            # The page URL carries the subject so the page stand-in can render matching text
+            results = [{'url': f"{self.server.pages_url}/{quote(subject)}/{config.page_id(topic, i)}",
+                        'title': f"{subject.title()} update {i}",
+                        'snippet': f"Coverage of {subject}."}
+                       for i in range(config.results_per_search)]
+        elif prompt.startswith('Analyze if'):
+            content = json.dumps({'relevance_score': 0.8, 'reasoning': 'Stand-in analysis',
+                                  'key_themes': ['stand-in'], 'is_relevant': True})
+            results = []
+        else:
+            content = _padded("This is a stand-in summary. ", min(config.content_bytes, 400))
+            results = []
+
+        prompt_tokens = sum(len(message['content']) for message in payload['messages']) // 4
+        completion_tokens = len(content) // 4
+        response = {
+            'id': f"standin-{self.server.requests_served}",
+            'model': payload.get('model', 'sonar'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens}
+        }
+        if results:
+            response['search_results'] = results
+        return response
+
+
+class PageHandler(_Handler):
+    """Serves synthetic article pages for the page fetcher"""
+
+    def do_GET(self):
+        self.server.count()
+        self.server.config.delay()
+        if self._maybe_fail():
+            return
+        config = self.server.config
+        subject = unquote(self.path.strip('/').split('/')[0])
+        # Duplicate pages carry their subject's lead story, as syndicated copies would
+        seed = subject if config.chance(config.duplicate_rate, 'duplicate', self.path) else self.path
+        story = _story(seed, config.content_bytes)
+        body = (f"<html><head><title>{subject.title()}: stand-in article</title>"
+                f"<meta property=\"og:description\" content=\"The latest on {subject}.\"></head>"
+                f"<body><h1>{subject.title()}</h1><p>{subject.capitalize()} news. {story}</p></body></html>")
+        self._reply(200, body, content_type='text/html; charset=utf-8')
+
+
+class GmailHandler(_Handler):
+    """Accepts single and batched users.messages.send requests"""
+
+    def do_POST(self):
+        body = self._read_body()
+        self.server.config.delay()
+        if self.path.startswith('/batch'):
+            self._batch(body)
+            return
+        self.server.count()
+        if self._maybe_fail():
+            return
+        self._reply(200, json.dumps({'id': f"msg-{self.server.requests_served}", 'labelIds': ['SENT']}))
+
+    def _batch(self, body):
+        boundary = re.search(r'boundary="?([^";]+)', self.headers['Content-Type']).group(1)
+        parts = [part for part in body.split(b'--' + boundary.encode()) if b'Content-ID' in part]
+        chunks = []
+        for part in parts:
+            content_id = re.search(rb'Content-ID: <(.+?)>', part).group(1).decode()
+            number = self.server.count()
+            if self.server.config.should_fail():
+                status, payload = '503 Service Unavailable', json.dumps({'error': {'code': 503}})
+            else:
+                status, payload = '200 OK', json.dumps({'id': f"msg-{number}", 'labelIds': ['SENT']})
+            chunks.append(
+                f"--standin\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n"
+                f"{payload}\r\n"
+            )
+        self._reply(200, ''.join(chunks) + '--standin--\r\n', content_type='multipart/mixed; boundary=standin')
+
+
+def start_perplexity(config, pages_url):
+    server = _StandInServer(PerplexityHandler, config)
+    server.pages_url = pages_url
+    return server.start()
+
+
+def start_pages(config):
+    return _StandInServer(PageHandler, config).start()
+
+
+def start_gmail(config):
+    return _StandInServer(GmailHandler, config).start()
+
+
+def gmail_service(base_url):
+    """Build a Gmail client from the bundled discovery document, pointed at a stand-in"""
+    from google.auth.credentials import AnonymousCredentials
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+
+    document = json.loads(get_static_doc('gmail', 'v1'))
+    document['rootUrl'] = base_url.rstrip('/') + '/'
+    return build_from_document(document, credentials=AnonymousCredentials())
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import logging
+import time
+import zlib
+
+from config import *
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+
+class CompletionCache(SQLiteStore):
+    """Persistent, size-bounded LRU cache of Perplexity completions keyed by request content"""
+
+    def __init__(self, path=CACHE_FILE, max_bytes=CACHE_MAX_BYTES, ttls=CACHE_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self.hits = 0
+        self.misses = 0
+        super().__init__(path)
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        # The size total lives in the database and is kept by triggers, so every process
+        # sharing the file sees the same total
+        with self._conn:
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    stage TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute('CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed_at)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS completions_size '
+                               '(id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL)')
+            self._conn.execute('INSERT OR IGNORE INTO completions_size (id, total) '
+                               'SELECT 0, COALESCE(SUM(size), 0) FROM completions')
+            self._conn.execute('CREATE TRIGGER IF NOT EXISTS completions_added AFTER INSERT ON completions '
+                               'BEGIN UPDATE completions_size SET total = total + NEW.size; END')
+            self._conn.execute('CREATE TRIGGER IF NOT EXISTS completions_removed AFTER DELETE ON completions '
+                               'BEGIN UPDATE completions_size SET total = total - OLD.size; END')
+
+    @staticmethod
+    def make_key(payload):
+        """Hash the model, messages and request parameters into a stable cache key"""
+        encoded = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def _ttl(self, stage):
+        return self.ttls.get(stage, self.ttls.get('default', 0))
+
+    def get(self, key, stage):
+        """Return the cached response for key, or None if missing or older than the stage TTL
+
+        The response carries the time its request was made as 'cached_at'.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, created_at FROM completions WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self._ttl(stage):
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE completions SET accessed_at = ? WHERE key = ?', (now, key))
+            self.hits += 1
+        response = json.loads(zlib.decompress(row[0]).decode('utf-8'))
+        response['cached_at'] = row[1]
+        return response
+
+    def put(self, key, stage, response, created_at=None):
+        """Store a response and evict least recently used entries beyond the size bound
+
+        created_at is when the request was made, defaulting to now.
+        """
+        value = zlib.compress(json.dumps(response, separators=(',', ':')).encode('utf-8'))
+        now = time.time()
+        with self._lock, self._conn:
+            # Deleted rather than replaced, since REPLACE does not fire the delete trigger
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._conn.execute('DELETE FROM completions WHERE key = ?', (key,))
+            self._conn.execute(
+                'INSERT INTO completions (key, stage, value, size, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, stage, value, len(value), created_at or now, now)
+            )
+            total = self._total_bytes()
+            if total > self.max_bytes:
+                self._evict(total)
+
+    def _total_bytes(self):
+        return self._conn.execute('SELECT total FROM completions_size').fetchone()[0]
+
+    def _evict(self, total):
+        # Trim to 90% of the bound so eviction is not triggered on every insert
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute('SELECT key, size FROM completions ORDER BY accessed_at').fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= target:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany('DELETE FROM completions WHERE key = ?', evicted)
+        logger.debug("Evicted %s cached completions", len(evicted))
+
+    def stats(self):
+        """Return hit/miss counters and the current cache size"""
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM completions').fetchone()[0]
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': entries,
+                'bytes': self._total_bytes()
+            }
@@ -6,15 +6,167 @@ load_dotenv()
 
 # Perplexity API Configuration
 PERPLEXITY_API_KEY = os.getenv('PERPLEXITY_API_KEY')
+PERPLEXITY_API_BASE = os.getenv('PERPLEXITY_API_BASE', 'https://api.perplexity.ai')
+# (connect, read) timeouts in seconds for each Perplexity request
+PERPLEXITY_TIMEOUT = (
+    float(os.getenv('PERPLEXITY_CONNECT_TIMEOUT', '5')),
+    float(os.getenv('PERPLEXITY_READ_TIMEOUT', '60'))
+)
+# Retries for 429/5xx responses and connection errors, with jittered exponential backoff
+PERPLEXITY_MAX_RETRIES = int(os.getenv('PERPLEXITY_MAX_RETRIES', '4'))
+PERPLEXITY_BACKOFF_BASE = 1.0  # seconds
+PERPLEXITY_BACKOFF_MAX = 30.0  # seconds, also the longest Retry-After wait honored
+# Read completions as server-sent events so callers can act on partial output
+PERPLEXITY_STREAMING = os.getenv('PERPLEXITY_STREAMING', 'true').lower() == 'true'
 
 # Gmail API Configuration
 GMAIL_CREDENTIALS_FILE = os.getenv('GMAIL_CREDENTIALS_FILE', 'credentials.json')
 GMAIL_TOKEN_FILE = os.getenv('GMAIL_TOKEN_FILE', 'token.json')
 GMAIL_SCOPES = ['https://www.googleapis.com/auth/gmail.send']
 
+# Concurrency Configuration
+# Maximum number of topics processed at the same time (1 = sequential)
+MAX_CONCURRENT_TOPICS = int(os.getenv('MAX_CONCURRENT_TOPICS', '8'))
+# Upper bound on Perplexity API requests per second across all workers (0 = unlimited)
+PERPLEXITY_MAX_RPS = float(os.getenv('PERPLEXITY_MAX_RPS', '5'))
+# Keep-alive connections held open to Perplexity; one per concurrent topic
+PERPLEXITY_POOL_SIZE = MAX_CONCURRENT_TOPICS
+
+# Pipeline Configuration
+# 'multi_stage' makes separate search, verify, relevance and summary calls per topic.
+# 'structured' asks for validated JSON articles in a single call per batch of topics,
+# falling back to 'multi_stage' for a batch whose response fails validation.
+PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'multi_stage')
+STRUCTURED_BATCH_SIZE = int(os.getenv('STRUCTURED_BATCH_SIZE', '1'))  # topics per request
+STRUCTURED_RELEVANCE_THRESHOLD = 0.6
+MAX_ARTICLES_PER_TOPIC = int(os.getenv('MAX_ARTICLES_PER_TOPIC', '3'))
+
+# Prompt Configuration
+# Shared system message sent with every Perplexity request
+SYSTEM_PROMPT = 'You are a concise, factual news research assistant.'
+# Approximate prompt tokens per stage; article content is condensed and truncated to fit
+PROMPT_TOKEN_BUDGETS = {
+    'search': 100,
+    'structured': 400,
+    'verify': 500,
+    'relevance': 500,
+    'summary': 800,
+    'default': 800
+}
+# Trusted sources are sent as search_domain_filter, which accepts a limited number of domains
+SEARCH_DOMAIN_FILTER_MAX = int(os.getenv('SEARCH_DOMAIN_FILTER_MAX', '20'))
+
+# Article Page Fetching Configuration
+# Every search result is fetched to extract its own title and lead text
+PAGE_FETCH_ENABLED = os.getenv('PAGE_FETCH_ENABLED', 'true').lower() == 'true'
+PAGE_FETCH_WORKERS = int(os.getenv('PAGE_FETCH_WORKERS', '16'))
+PAGE_FETCH_PER_HOST = int(os.getenv('PAGE_FETCH_PER_HOST', '2'))  # concurrent connections per host
+PAGE_FETCH_MAX_BYTES = int(os.getenv('PAGE_FETCH_MAX_BYTES', str(512 * 1024)))
+PAGE_FETCH_TIMEOUT = (3.0, 10.0)  # (connect, read) seconds
+PAGE_FETCH_DEADLINE = float(os.getenv('PAGE_FETCH_DEADLINE', '15'))  # seconds for a whole download
+PAGE_LEAD_CHARS = 1500  # characters of lead text kept per article
+PAGE_PREFETCH_LIMIT = 1024  # pages started from streaming search results and not yet collected
+
+# Local Relevance Pre-filter Configuration
+# Candidates are scored locally against their topic (cosine similarity, 0-1). Scores at or
+# above the accept threshold skip the LLM relevance check, scores below the reject
+# threshold are dropped, and only the band in between is sent to Perplexity.
+RELEVANCE_PREFILTER_ENABLED = os.getenv('RELEVANCE_PREFILTER_ENABLED', 'true').lower() == 'true'
+RELEVANCE_ACCEPT_THRESHOLD = float(os.getenv('RELEVANCE_ACCEPT_THRESHOLD', '0.25'))
+RELEVANCE_REJECT_THRESHOLD = float(os.getenv('RELEVANCE_REJECT_THRESHOLD', '0.04'))
+RELEVANCE_HASH_DIM = 2 ** 14  # hashed feature buckets per vector
+
+# Duplicate Story Configuration
+# Candidates whose title and lead text are near-duplicates of an earlier candidate are not
+# summarized again; their URLs are listed as alternate sources of the first one instead
+DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', 'true').lower() == 'true'
+DEDUP_MAX_DISTANCE = int(os.getenv('DEDUP_MAX_DISTANCE', '3'))  # differing SimHash bits, out of 64
+DEDUP_MIN_WORDS = 8  # shorter texts are too short to compare reliably
+
+# Local storage for caches and run state
+DATA_DIR = os.getenv('NEWS_DATA_DIR', '.newsletter')
+
+# Completion Cache Configuration
+CACHE_ENABLED = os.getenv('CACHE_ENABLED', 'true').lower() == 'true'
+CACHE_FILE = os.path.join(DATA_DIR, 'completions.db')
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# Seconds a cached completion stays valid for each pipeline stage
+CACHE_TTL = {
+    'search': 60 * 60,
+    'structured': 60 * 60,
+    'verify': 24 * 60 * 60,
+    'relevance': 24 * 60 * 60,
+    'summary': 30 * 24 * 60 * 60,
+    'default': 60 * 60
+}
+
+# Seen-Article Index Configuration
+# Delivered article URLs are remembered so overlapping news windows do not resend them
+SEEN_INDEX_ENABLED = os.getenv('SEEN_INDEX_ENABLED', 'true').lower() == 'true'
+SEEN_INDEX_FILE = os.path.join(DATA_DIR, 'seen_articles.db')
+SEEN_ARTICLE_TTL_DAYS = int(os.getenv('SEEN_ARTICLE_TTL_DAYS', '7'))
+
+# Logging and Metrics Configuration
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# Run summaries are appended as JSON lines ('jsonl') or written as a Prometheus
+# node-exporter textfile ('prometheus'); an empty METRICS_FILE disables them
+METRICS_FORMAT = os.getenv('METRICS_FORMAT', 'jsonl')
+METRICS_FILE = os.getenv('METRICS_FILE', os.path.join(DATA_DIR, 'metrics.jsonl'))
+
+# Scheduling Configuration
+STATE_FILE = os.path.join(DATA_DIR, 'state.db')
+DIGEST_TIME = os.getenv('DIGEST_TIME', '08:00')  # local time the daily digest is sent
+# Hours between fetches for individual topics. Topics refreshed more often than daily
+# collect articles published since their last successful fetch, which are held until
+# the next digest. For example: {'crypto': 1, 'startup funding': 24}
+TOPIC_CADENCES = {}
+DEFAULT_TOPIC_CADENCE_HOURS = 24
+# Digest runs checkpoint each topic's search and article stages and each delivered email,
+# so a retry after a crash resumes from the first incomplete stage
+CHECKPOINT_ENABLED = os.getenv('CHECKPOINT_ENABLED', 'true').lower() == 'true'
+CHECKPOINT_RESUME_HOURS = 12  # incomplete runs younger than this are resumed automatically
+CHECKPOINT_RETENTION_DAYS = 7
+# With a deadline, the digest goes out this many seconds after a run starts with the topics
+# finished by then. Late topics are sent in a follow-up email once they finish
+# (LATE_TOPIC_POLICY='follow_up') or left out of the day's digest ('drop'). 0 waits for every topic.
+DIGEST_DEADLINE_SECONDS = float(os.getenv('DIGEST_DEADLINE_SECONDS', '0'))
+LATE_TOPIC_POLICY = os.getenv('LATE_TOPIC_POLICY', 'follow_up')
+# Under a deadline, topics with a higher priority start first, then the fastest by recorded
+# search latency. For example: {'markets': 10}. Topics default to priority 0.
+TOPIC_PRIORITIES = {}
+TOPIC_LATENCY_WEIGHT = 0.3  # weight of the latest search in a topic's recorded latency
+
+# Archive Configuration
+# Every accepted article is kept in a full-text indexed archive that archive.py queries
+# to build past or ad-hoc digests without API calls
+ARCHIVE_ENABLED = os.getenv('ARCHIVE_ENABLED', 'true').lower() == 'true'
+ARCHIVE_FILE = os.getenv('ARCHIVE_FILE', os.path.join(DATA_DIR, 'archive.db'))
+ARCHIVE_QUERY_LIMIT = 50  # articles in a digest built from the archive
+
+# Job Queue Configuration
+# Coordinator and worker processes (--coordinate, --worker) share jobs through this file
+JOB_QUEUE_FILE = os.getenv('JOB_QUEUE_FILE', os.path.join(DATA_DIR, 'jobs.db'))
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '300'))  # a claimed job is retried elsewhere after this
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_POLL_SECONDS = 1
+JOB_RETENTION_DAYS = 7
+
 # Email Configuration
 EMAIL_SENDER = os.getenv('EMAIL_SENDER')
 EMAIL_RECIPIENT = os.getenv('EMAIL_RECIPIENT')
+RENDER_SECTION_CACHE_SIZE = 1024  # rendered per-topic digest sections kept for reuse
+# Optional JSON list of subscribers with their own topics; when missing, EMAIL_RECIPIENT
+# receives a digest of DEFAULT_TOPICS
+SUBSCRIBERS_FILE = os.getenv('SUBSCRIBERS_FILE', 'subscribers.json')
+# Gmail sends are grouped into batch HTTP requests (Gmail allows at most 100 per batch)
+GMAIL_BATCH_SIZE = int(os.getenv('GMAIL_BATCH_SIZE', '50'))
+GMAIL_SEND_CONCURRENCY = int(os.getenv('GMAIL_SEND_CONCURRENCY', '2'))  # batches in flight
+GMAIL_TIMEOUT = 60  # seconds, as for the client googleapiclient builds
+
+# Source Configuration
+# Optional JSON file with source allow/block lists, per-topic allowlists and ranking
+# weights; without it, results are limited to TRUSTED_SOURCES
+SOURCES_FILE = os.getenv('SOURCES_FILE', 'sources.json')
 
 # News Configuration
 NEWS_TIME_WINDOW = 24  # hours
@@ -0,0 +1,153 @@
+import threading
+from collections import OrderedDict
+from itertools import groupby
+from operator import itemgetter, methodcaller
+from urllib.parse import urlsplit
+
+from config import *
+
+HTML_HEADER = """
+        <html>
+        <head>
+            <style>
+                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+                .article { margin-bottom: 30px; padding-bottom: 20px; border-bottom: 1px solid #eee; }
+                .topic { font-weight: bold; color: #2c3e50; font-size: 1.2em; }
+                .title { font-size: 1.1em; margin: 10px 0; }
+                .summary { margin: 10px 0; }
+                .source { color: #3498db; text-decoration: none; }
+                .source:hover { text-decoration: underline; }
+                .alternates { color: #777; font-size: 0.9em; margin-top: 5px; }
+            </style>
+        </head>
+        <body>
+            <h2>Today's News Digest</h2>
+        """
+
+HTML_FOOTER = """
+        </body>
+        </html>
+        """
+
+PLAIN_HEADER = "Here are today's relevant news articles:\n\n"
+
+PLAIN_RULE = "-" * 80
+
+TEXT_ESCAPES = (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'))
+ATTRIBUTE_ESCAPES = TEXT_ESCAPES + (('"', '&quot;'),)
+
+
+def escape_all(values, escapes=TEXT_ESCAPES):
+    """HTML-escape each of values, returning a list in the same order
+
+    The values are joined so each character is searched for once per call rather than once
+    per value. Most titles, summaries and URLs contain nothing to escape, and then nothing
+    is replaced or split.
+    """
+    joined = '\0'.join(values)
+    changed = False
+    for char, entity in escapes:
+        if char in joined:
+            joined = joined.replace(char, entity)
+            changed = True
+    if not changed:
+        return list(values)
+    escaped = joined.split('\0')
+    if len(escaped) == len(values):
+        return escaped
+    # A value contained the separator itself
+    escaped = []
+    for value in values:
+        for char, entity in escapes:
+            value = value.replace(char, entity)
+        escaped.append(value)
+    return escaped
+
+
+_get_title = itemgetter('title')
+_get_summary = itemgetter('summary')
+_get_url = itemgetter('url')
+_get_alternates = methodcaller('get', 'alternates')
+
+
+class DigestRenderer:
+    """Renders digest emails in one pass, caching rendered per-topic sections for reuse"""
+
+    def __init__(self, cache_size=RENDER_SECTION_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._sections = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _section_key(topic, articles):
+        # The fields themselves are the key: tuples of strings hash quickly and never collide
+        alternates = tuple(map(_get_alternates, articles))
+        if any(alternates):
+            alternates = tuple([tuple(urls or ()) for urls in alternates])
+        return (topic, tuple(map(_get_title, articles)), tuple(map(_get_summary, articles)),
+                tuple(map(_get_url, articles)), alternates)
+
+    def render_section(self, topic, articles):
+        """Return the (html, plain) fragments for one topic's articles, reusing cached renders
+
+        Fragments are tuples of per-article strings, joined only once for the whole digest.
+        """
+        key = self._section_key(topic, articles)
+        with self._lock:
+            if key in self._sections:
+                self._sections.move_to_end(key)
+                return self._sections[key]
+
+        _, titles, summaries, urls, alternates = key
+        html_topic = escape_all([topic])[0]
+        if any(alternates):
+            html_extras, plain_extras = zip(*[self._render_alternates(article_alternates)
+                                              for article_alternates in alternates])
+        else:
+            html_extras = plain_extras = [''] * len(titles)
+        html_parts = tuple([f"""
+            <div class="article">
+                <div class="topic">Topic: {html_topic}</div>
+                <div class="title">{title}</div>
+                <div class="summary">{summary}</div>
+                <a href="{url}" class="source">Source</a>{extra}
+            </div>
+            """ for title, summary, url, extra in zip(escape_all(titles), escape_all(summaries),
+                                                      escape_all(urls, ATTRIBUTE_ESCAPES), html_extras)])
+        plain_parts = tuple([f"Topic: {topic}\nTitle: {title}\nSummary: {summary}\nSource: {url}\n"
+                             f"{extra}\n{PLAIN_RULE}\n\n"
+                             for title, summary, url, extra in zip(titles, summaries, urls, plain_extras)])
+        section = (html_parts, plain_parts)
+
+        with self._lock:
+            self._sections[key] = section
+            if len(self._sections) > self.cache_size:
+                self._sections.popitem(last=False)
+        return section
+
+    @staticmethod
+    def _render_alternates(urls):
+        """(html, plain) lines listing an article's alternate sources, empty without any"""
+        if not urls:
+            return '', ''
+        hosts = escape_all([urlsplit(url).hostname or url for url in urls])
+        links = ', '.join(f'<a href="{href}" class="source">{host}</a>'
+                          for href, host in zip(escape_all(urls, ATTRIBUTE_ESCAPES), hosts))
+        return (f'\n                <div class="alternates">Also reported by: {links}</div>',
+                f"Also reported by: {', '.join(urls)}\n")
+
+    def render_sections(self, sections):
+        """Render a digest from (topic, articles) pairs, returning (html_content, plain_content)"""
+        html_parts = [HTML_HEADER]
+        plain_parts = [PLAIN_HEADER]
+        for topic, articles in sections:
+            html_section, plain_section = self.render_section(topic, articles)
+            html_parts.extend(html_section)
+            plain_parts.extend(plain_section)
+        html_parts.append(HTML_FOOTER)
+        return ''.join(html_parts), ''.join(plain_parts)
+
+    def render(self, articles):
+        """Render a digest for articles, grouping consecutive articles that share a topic"""
+        sections = [(topic, list(group)) for topic, group in groupby(articles, key=itemgetter('topic'))]
+        return self.render_sections(sections)
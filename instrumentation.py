@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from config import *
+
+logger = logging.getLogger(__name__)
+
+
+def configure_logging(level=LOG_LEVEL):
+    """Configure leveled logging for the application entry point"""
+    logging.basicConfig(
+        level=getattr(logging, str(level).upper(), logging.INFO),
+        format='%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s'
+    )
+
+
+class LazyJSON:
+    """Defers pretty-printing a payload until a log record is actually emitted"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return json.dumps(self.value, indent=2)
+
+
+class Metrics:
+    """Thread-safe per-stage timing, API call and token usage counters for one digest run
+
+    Stages are free-form names; the pipeline uses search, verify, relevance, summary,
+    fetch, render and send.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Start a new run, discarding everything recorded so far"""
+        with self._lock:
+            self.started_at = time.time()
+            self._durations = defaultdict(list)
+            self._api_calls = defaultdict(int)
+            self._cache_hits = defaultdict(int)
+            self._tokens = defaultdict(lambda: defaultdict(int))
+            self._counters = defaultdict(int)
+
+    @contextmanager
+    def span(self, stage):
+        """Time the enclosed block and record it under stage"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._durations[stage].append(elapsed)
+
+    def record_api_call(self, stage, usage=None):
+        """Count a Perplexity API call and the token usage reported in its response"""
+        with self._lock:
+            self._api_calls[stage] += 1
+            for kind, count in (usage or {}).items():
+                if isinstance(count, (int, float)):
+                    self._tokens[stage][kind] += count
+
+    def record_prompt(self, stage, tokens, saved):
+        """Count the estimated prompt tokens built for stage and the tokens saved by budgeting"""
+        with self._lock:
+            self._tokens[stage]['prompt_estimate'] += tokens
+            self._tokens[stage]['prompt_saved'] += saved
+            self._counters['prompt_tokens_saved'] += saved
+
+    def record_cache_hit(self, stage):
+        with self._lock:
+            self._cache_hits[stage] += 1
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def summary(self):
+        """Return a JSON-serializable summary of the run so far"""
+        with self._lock:
+            stages = {}
+            for stage in set(self._durations) | set(self._api_calls) | set(self._cache_hits) | set(self._tokens):
+                durations = sorted(self._durations.get(stage, []))
+                count = len(durations)
+                stages[stage] = {
+                    'count': count,
+                    'total_seconds': sum(durations),
+                    'p50_seconds': durations[int(0.50 * (count - 1))] if count else 0.0,
+                    'p95_seconds': durations[int(0.95 * (count - 1))] if count else 0.0,
+                    'max_seconds': durations[-1] if count else 0.0,
+                    'api_calls': self._api_calls.get(stage, 0),
+                    'cache_hits': self._cache_hits.get(stage, 0),
+                    'tokens': dict(self._tokens.get(stage, {}))
+                }
+            return {
+                'started_at': self.started_at,
+                'duration_seconds': time.time() - self.started_at,
+                'stages': stages,
+                'counters': dict(self._counters)
+            }
+
+    def log_summary(self):
+        """Log one line per stage with its timings, API calls and tokens"""
+        summary = self.summary()
+        logger.info("Run finished in %.2fs %s", summary['duration_seconds'], summary['counters'])
+        for stage, stats in sorted(summary['stages'].items()):
+            logger.info("Stage %s: %s spans, total %.2fs, p50 %.2fs, p95 %.2fs, %s API calls, %s cache hits, tokens %s",
+                        stage, stats['count'], stats['total_seconds'], stats['p50_seconds'],
+                        stats['p95_seconds'], stats['api_calls'], stats['cache_hits'], stats['tokens'])
+
+    def write(self, path=METRICS_FILE, fmt=METRICS_FORMAT):
+        """Write the run summary as an appended JSON line or a Prometheus textfile"""
+        if not path:
+            return
+        summary = self.summary()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if fmt == 'prometheus':
+            # Write then rename so the node exporter never reads a half-written file
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(self._prometheus(summary))
+            os.replace(tmp_path, path)
+        else:
+            with open(path, 'a') as f:
+                f.write(json.dumps(summary, sort_keys=True) + '\n')
+        logger.debug("Wrote run metrics to %s", path)
+
+    @staticmethod
+    def _prometheus(summary):
+        lines = [
+            '# TYPE newsletter_run_duration_seconds gauge',
+            f"newsletter_run_duration_seconds {summary['duration_seconds']:.6f}",
+            '# TYPE newsletter_run_timestamp_seconds gauge',
+            f"newsletter_run_timestamp_seconds {summary['started_at']:.0f}",
+            '# TYPE newsletter_stage_duration_seconds summary'
+        ]
+        for stage, stats in sorted(summary['stages'].items()):
+            lines.append(f'newsletter_stage_duration_seconds{{stage="{stage}",quantile="0.5"}} {stats["p50_seconds"]:.6f}')
+            lines.append(f'newsletter_stage_duration_seconds{{stage="{stage}",quantile="0.95"}} {stats["p95_seconds"]:.6f}')
+            lines.append(f'newsletter_stage_duration_seconds_sum{{stage="{stage}"}} {stats["total_seconds"]:.6f}')
+            lines.append(f'newsletter_stage_duration_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        lines.append('# TYPE newsletter_api_calls gauge')
+        for stage, stats in sorted(summary['stages'].items()):
+            lines.append(f'newsletter_api_calls{{stage="{stage}"}} {stats["api_calls"]}')
+        lines.append('# TYPE newsletter_cache_hits gauge')
+        for stage, stats in sorted(summary['stages'].items()):
+            lines.append(f'newsletter_cache_hits{{stage="{stage}"}} {stats["cache_hits"]}')
+        lines.append('# TYPE newsletter_tokens gauge')
+        for stage, stats in sorted(summary['stages'].items()):
+            for kind, count in sorted(stats['tokens'].items()):
+                lines.append(f'newsletter_tokens{{stage="{stage}",type="{kind}"}} {count}')
+        lines.append('# TYPE newsletter_run_counter gauge')
+        for name, value in sorted(summary['counters'].items()):
+            lines.append(f'newsletter_run_counter{{name="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
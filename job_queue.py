@@ -0,0 +1,163 @@
+import json
+import logging
+import time
+
+from config import *
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+QUEUED, LEASED, DONE, FAILED = 'queued', 'leased', 'done', 'failed'
+
+
+class JobQueue(SQLiteStore):
+    """Durable SQLite job queue with leases, shared by a coordinator and its worker processes
+
+    A claimed job is leased to one worker for lease_seconds. If the worker dies or stalls,
+    the lease expires and another worker claims the job again, until max_attempts is reached.
+    """
+
+    def __init__(self, path=JOB_QUEUE_FILE, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Several processes write to the file, so wait on their locks instead of failing
+        super().__init__(path, timeout=30)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                run_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                UNIQUE (run_id, key, stage)
+            );
+            CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (run_id, status, lease_expires);
+        """)
+
+    def enqueue(self, run_id, jobs):
+        """Add (key, stage, payload) jobs to a run; jobs already in the run are left as they are"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._enqueue(run_id, jobs, now)
+            self._conn.execute('COMMIT')
+
+    def _enqueue(self, run_id, jobs, now):
+        self._conn.executemany(
+            'INSERT OR IGNORE INTO jobs (run_id, key, stage, payload, status, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(run_id, key, stage, json.dumps(payload), QUEUED, now, now) for key, stage, payload in jobs]
+        )
+
+    def claim(self, owner, run_id=None):
+        """Lease the oldest available job to owner, returning it as a dict or None"""
+        now = time.time()
+        run_clause, run_args = ('AND run_id = ? ', (run_id,)) if run_id is not None else ('', ())
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Jobs whose last lease expired with no attempts left are given up on
+                self._conn.execute(
+                    f'UPDATE jobs SET status = ?, error = ?, updated_at = ? '
+                    f'WHERE status = ? AND lease_expires < ? AND attempts >= ? {run_clause}',
+                    (FAILED, 'lease expired', now, LEASED, now, self.max_attempts) + run_args
+                )
+                row = self._conn.execute(
+                    f'SELECT id, run_id, key, stage, payload, attempts FROM jobs '
+                    f'WHERE (status = ? OR (status = ? AND lease_expires < ?)) {run_clause}'
+                    f'ORDER BY id LIMIT 1',
+                    (QUEUED, LEASED, now) + run_args
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        'UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?, '
+                        'lease_expires = ?, updated_at = ? WHERE id = ?',
+                        (LEASED, owner, now + self.lease_seconds, now, row[0])
+                    )
+            finally:
+                self._conn.execute('COMMIT')
+        if row is None:
+            return None
+        return {'id': row[0], 'run_id': row[1], 'key': row[2], 'stage': row[3],
+                'payload': json.loads(row[4]), 'attempts': row[5] + 1}
+
+    def extend_lease(self, job, owner):
+        """Renew owner's lease on a running job for another lease_seconds
+
+        Returns False if owner no longer holds the lease.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND status = ? AND lease_owner = ?',
+                (now + self.lease_seconds, now, job['id'], LEASED, owner)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job, owner, result, follow_up=()):
+        """Store a job's result and enqueue its follow-up jobs in one transaction
+
+        Returns False, without storing anything, if owner no longer holds the lease.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            cursor = self._conn.execute(
+                'UPDATE jobs SET status = ?, result = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? '
+                'WHERE id = ? AND status = ? AND lease_owner = ?',
+                (DONE, json.dumps(result), now, job['id'], LEASED, owner)
+            )
+            completed = cursor.rowcount == 1
+            if completed and follow_up:
+                self._enqueue(job['run_id'], follow_up, now)
+            self._conn.execute('COMMIT')
+        if not completed:
+            logger.warning("Lost the lease on job %s (%s %s) before it finished", job['id'], job['stage'], job['key'])
+        return completed
+
+    def fail(self, job, owner, error):
+        """Release a failed job for another attempt, or mark it failed once attempts run out"""
+        status = FAILED if job['attempts'] >= self.max_attempts else QUEUED
+        with self._lock:
+            self._conn.execute(
+                'UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? '
+                'WHERE id = ? AND status = ? AND lease_owner = ?',
+                (status, str(error), time.time(), job['id'], LEASED, owner)
+            )
+
+    def counts(self, run_id):
+        """Return {status: job count} for a run"""
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM jobs WHERE run_id = ? GROUP BY status',
+                                      (run_id,)).fetchall()
+        return dict(rows)
+
+    def unfinished(self, run_id):
+        """Number of a run's jobs that are queued or leased"""
+        counts = self.counts(run_id)
+        return counts.get(QUEUED, 0) + counts.get(LEASED, 0)
+
+    def results(self, run_id, stages):
+        """Return [(key, stage, result)] for the finished jobs of a run in the given stages"""
+        marks = ', '.join('?' for _ in stages)
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT key, stage, result FROM jobs WHERE run_id = ? AND status = ? AND stage IN ({marks}) '
+                f'ORDER BY id', (run_id, DONE) + tuple(stages)
+            ).fetchall()
+        return [(key, stage, json.loads(result)) for key, stage, result in rows]
+
+    def prune(self, retention_days=JOB_RETENTION_DAYS):
+        """Delete runs whose newest job is older than the retention period"""
+        cutoff = time.time() - retention_days * 24 * 60 * 60
+        with self._lock:
+            self._conn.execute('DELETE FROM jobs WHERE run_id IN '
+                               '(SELECT run_id FROM jobs GROUP BY run_id HAVING MAX(updated_at) < ?)', (cutoff,))
@@ -1,37 +1,100 @@
+import time
+# Captured before any other import so --once can report module import time
+_IMPORT_STARTED = time.perf_counter()
+
+import argparse
+import asyncio
 import os
 import json
-import schedule
-import time
+import logging
 import base64
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
-import requests
-from bs4 import BeautifulSoup
 from config import *
+import math
 import re
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from concurrent.futures import ThreadPoolExecutor, wait
+from perplexity_client import PerplexityClient, PerplexityAPIError
+from completion_cache import CompletionCache
+from structured_output import (StructuredOutputError, build_structured_query,
+                               parse_structured_response, response_format)
+from relevance_filter import ACCEPT, REJECT, RelevanceFilter
+from seen_index import SeenArticleIndex
+from source_registry import SourceRegistry
+from story_dedup import StoryIndex
+from page_fetcher import PageFetcher
+from digest_renderer import DigestRenderer
+from subscribers import SubscriberRegistry
+from prompt_builder import PromptBuilder, domain_filter
+from stream_parser import SearchStream, relevance_verdict
+from archive import ArticleArchive
+from state_store import RunCheckpoint, StateStore, new_run_id
+from job_queue import JobQueue
+from scheduler import TopicScheduler
+from workers import Coordinator, Worker
+from instrumentation import LazyJSON, Metrics, configure_logging
+
+logger = logging.getLogger(__name__)
 
 class NewsAggregator:
-    def __init__(self):
+    def __init__(self, gmail_service=None, subscribers=None, lazy_gmail=False):
+        """Create the aggregator; gmail_service and subscribers may be injected instead of loaded
+
+        With lazy_gmail the Google client libraries are imported and the Gmail client is
+        built on first send instead of at construction.
+        """
         self.perplexity_api_key = PERPLEXITY_API_KEY
-        self.headers = {
-            'Authorization': f'Bearer {self.perplexity_api_key}',
-            'Content-Type': 'application/json'
-        }
-        self.gmail_service = self._get_gmail_service()
+        self.cache = CompletionCache() if CACHE_ENABLED else None
+        self.metrics = Metrics()
+        self.perplexity = PerplexityClient(self.perplexity_api_key, cache=self.cache, metrics=self.metrics)
+        self.prompts = PromptBuilder(metrics=self.metrics)
+        self.sources = SourceRegistry.load()
+        # Trusted sources go to Perplexity as a domain filter rather than as prompt text
+        self._domain_filters = {}
+        self.max_concurrent_topics = max(1, MAX_CONCURRENT_TOPICS)
+        self.pipeline_mode = PIPELINE_MODE
+        self.relevance_filter = RelevanceFilter() if RELEVANCE_PREFILTER_ENABLED else None
+        self.seen_index = SeenArticleIndex() if SEEN_INDEX_ENABLED else None
+        self.page_fetcher = PageFetcher(metrics=self.metrics) if PAGE_FETCH_ENABLED else None
+        self.renderer = DigestRenderer()
+        # Near-duplicate stories seen by the current search, see collapse_duplicates
+        self.stories = None
+        # Position of each topic in the current search, which ranks duplicate stories
+        self._topic_order = {}
+        self.state = StateStore()
+        self.archive = ArticleArchive() if ARCHIVE_ENABLED else None
+        self.checkpoint = None
+        # Start times of successful topic fetches in the current run, committed as watermarks
+        self._fetched_at = {}
+        self.gmail_credentials = None
+        self._gmail_service = gmail_service
+        if self._gmail_service is None and not lazy_gmail:
+            self._gmail_service = self._get_gmail_service()
         self.recipient_email = EMAIL_RECIPIENT
-        print(f"[DEBUG] Initialized NewsAggregator with Perplexity API key: {self.perplexity_api_key[:5]}...")
-        print(f"[DEBUG] Initialized Gmail API client")
+        self.subscribers = subscribers if subscribers is not None else SubscriberRegistry.load()
+        logger.debug("Initialized NewsAggregator with Perplexity API key: %s...", self.perplexity_api_key[:5])
+
+    @property
+    def gmail_service(self):
+        """Gmail API client, built on first use when construction was deferred"""
+        if self._gmail_service is None:
+            with self.metrics.span('gmail_init'):
+                self._gmail_service = self._get_gmail_service()
+        return self._gmail_service
 
     def _get_gmail_service(self):
         """Set up Gmail API service"""
-        creds = None
+        # Imported here so startup does not pay for the Google client libraries until mail is sent
+        from google.oauth2.credentials import Credentials
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        from google.auth.transport.requests import Request
+        from googleapiclient.discovery import build
+
+        # Credentials refreshed earlier in this process are reused instead of re-reading the file
+        creds = self.gmail_credentials
         # The file token.json stores the user's access and refresh tokens
-        if os.path.exists(GMAIL_TOKEN_FILE):
+        if creds is None and os.path.exists(GMAIL_TOKEN_FILE):
             creds = Credentials.from_authorized_user_file(GMAIL_TOKEN_FILE, GMAIL_SCOPES)
         
         # If there are no (valid) credentials available, let the user log in
@@ -46,7 +109,10 @@ class NewsAggregator:
             with open(GMAIL_TOKEN_FILE, 'w') as token:
                 token.write(creds.to_json())
 
-        return build('gmail', 'v1', credentials=creds)
+        self.gmail_credentials = creds
+        logger.debug("Initialized Gmail API client")
+        # The discovery document bundled with google-api-python-client avoids a network round trip
+        return build('gmail', 'v1', credentials=creds, static_discovery=True, cache_discovery=False)
 
     def _create_message(self, sender, to, subject, html_content, plain_content):
         """Create a message for an email."""
@@ -63,166 +129,512 @@ class NewsAggregator:
         raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
         return {'raw': raw_message}
 
+    def _map_concurrently(self, func, items):
+        """Apply func to every item with bounded parallelism, returning results in input order"""
+        if self.max_concurrent_topics == 1 or len(items) <= 1:
+            return [func(item) for item in items]
+        # Executor.map yields results in submission order, so the output matches
+        # the sequential path regardless of which item finishes first
+        logger.debug("Processing %s items with up to %s in flight", len(items), self.max_concurrent_topics)
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_topics) as executor:
+            return list(executor.map(func, items))
+
     def search_news(self, topics):
         """Search for news articles using Perplexity API"""
         articles = []
-        
-        for topic in topics:
-            print(f"\n[DEBUG] Searching news for topic: {topic}")
-            query = f"Find recent news articles from the last {NEWS_TIME_WINDOW} hours about {topic} from these sources: {', '.join(TRUSTED_SOURCES)}"
-            print(f"[DEBUG] Perplexity API Query: {query}")
-            
-            try:
-                print("[DEBUG] Making request to Perplexity API...")
-                response = requests.post(
-                    'https://api.perplexity.ai/chat/completions',
-                    headers=self.headers,
-                    json={
-                        'model': 'sonar',
-                        'messages': [{'role': 'user', 'content': query}]
-                    }
+        # Candidates are clustered as they arrive so duplicates are never summarized
+        self.stories = StoryIndex() if DEDUP_ENABLED else None
+        self._topic_order = {topic: index for index, topic in enumerate(topics)}
+
+        if self.pipeline_mode == 'structured':
+            size = max(1, STRUCTURED_BATCH_SIZE)
+            batches = [topics[i:i + size] for i in range(0, len(topics), size)]
+            results = [topic_articles
+                       for batch_results in self._map_concurrently(self._search_structured, batches)
+                       for topic_articles in batch_results]
+        else:
+            responses = self._map_concurrently(self._fetch_topic, topics)
+            found = [(topic, response) for topic, response in zip(topics, responses) if response is not None]
+            # Score every search result against its topic in one batch before any LLM checks
+            verdicts = self._prefilter(found)
+            results = self._map_concurrently(
+                lambda item: self._topic_articles(item[0][0], item[0][1], item[1]),
+                list(zip(found, verdicts))
+            )
+
+        for topic_articles in results:
+            articles.extend(topic_articles)
+
+        return self.collapse_duplicates(articles)
+
+    def search_until(self, topics, deadline):
+        """Search topics until deadline (a time.time() value), returning (articles, late)
+
+        Topics are started in _order_topics order. articles are those of the topics finished
+        by the deadline, in topic order, and late is a list of (topics, future) pairs for the
+        rest. Under the 'drop' policy, late topics that have not started are cancelled.
+        """
+        self.stories = StoryIndex() if DEDUP_ENABLED else None
+        self._topic_order = {topic: index for index, topic in enumerate(topics)}
+        ordered = self._order_topics(topics)
+        size = max(1, STRUCTURED_BATCH_SIZE) if self.pipeline_mode == 'structured' else 1
+        units = [ordered[i:i + size] for i in range(0, len(ordered), size)]
+
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrent_topics)
+        futures = [executor.submit(self._search_unit, unit) for unit in units]
+        done, _ = wait(futures, timeout=max(0.0, deadline - time.time()))
+        if LATE_TOPIC_POLICY == 'drop':
+            # cancel() only stops topics that have not started; running searches finish in the background
+            for future in futures:
+                future.cancel()
+        executor.shutdown(wait=False)
+
+        by_topic = {}
+        late = []
+        for unit, future in zip(units, futures):
+            if future in done:
+                by_topic.update(zip(unit, future.result()))
+            else:
+                late.append((unit, future))
+        if late:
+            logger.info("%s topics missed the delivery deadline: %s", sum(len(unit) for unit, _ in late),
+                        [topic for unit, _ in late for topic in unit])
+        articles = [article for topic in topics for article in by_topic.get(topic, [])]
+        return self.collapse_duplicates(articles), late
+
+    def _order_topics(self, topics):
+        """Sort topics by priority, then by recorded search latency, fastest first
+
+        Topics never searched before are placed as if they took the median recorded latency.
+        """
+        latencies = self.state.latencies()
+        known = sorted(latencies[topic] for topic in topics if topic in latencies)
+        typical = known[len(known) // 2] if known else 0.0
+        return sorted(topics, key=lambda topic: (-TOPIC_PRIORITIES.get(topic, 0), latencies.get(topic, typical)))
+
+    def _search_unit(self, topics):
+        """Articles for each of topics: one structured batch, or multi-stage searches in turn"""
+        if self.pipeline_mode == 'structured':
+            return self._search_structured(topics)
+        return [self._search_topic(topic) for topic in topics]
+
+    def _finish_late(self, late, on_time=()):
+        """Wait for late (topics, future) pairs and return their articles
+
+        A future of None, from a resumed run, means the topics are searched again; their
+        stage checkpoints make that cheap when the interrupted run had finished them.
+        on_time are the articles already delivered: a late topic's story that duplicates
+        one of them was not summarized again, so it is listed under the late topic with
+        that article's summary.
+        """
+        late_topics = {topic for unit, _ in late for topic in unit}
+        articles = []
+        for unit, future in late:
+            results = future.result() if future is not None else self._search_unit(unit)
+            for topic_articles in results:
+                articles.extend(topic_articles)
+        articles = self.collapse_duplicates(articles)
+        if self.stories is not None:
+            clusters = self.stories.clusters()
+            keys = {(article['url'], article['topic']) for article in articles}
+            for article in on_time:
+                members = clusters.get(article['url'], [])
+                alternates = list(dict.fromkeys(url for url, _ in members if url != article['url']))
+                for topic in dict.fromkeys(topic for _, topic in members):
+                    if topic in late_topics and (article['url'], topic) not in keys:
+                        keys.add((article['url'], topic))
+                        articles.append(dict(article, topic=topic, alternates=alternates))
+        # A late story can take over a cluster from an on-time one, which must not be sent again
+        return [article for article in articles if article['topic'] in late_topics]
+
+    def collapse_duplicates(self, articles):
+        """Drop near-duplicate articles, listing their URLs as alternate sources of the one kept
+
+        Articles from the current search are already clustered; any others, such as structured
+        results or articles collected by workers, are clustered here. A story found under several
+        topics stays in each topic's section with the same summary.
+        """
+        if not DEDUP_ENABLED:
+            return articles
+        stories = self.stories if self.stories is not None else StoryIndex()
+        kept = [article for article in articles
+                if stories.add(f"{article['title']}\n{article['summary']}", article['url'], article['topic']) is None]
+        clusters = stories.clusters()
+        if len(kept) < len(articles):
+            logger.info("Collapsed %s near-duplicate articles", len(articles) - len(kept))
+
+        merged = []
+        keys = {(article['url'], article['topic']) for article in kept}
+        for article in kept:
+            members = clusters.get(article['url'], [])
+            alternates = list(dict.fromkeys(url for url, _ in members if url != article['url']))
+            if alternates:
+                article = dict(article, alternates=alternates)
+            merged.append(article)
+            for topic in dict.fromkeys(topic for _, topic in members):
+                if (article['url'], topic) not in keys:
+                    keys.add((article['url'], topic))
+                    merged.append(dict(article, topic=topic))
+        return merged
+
+    def _search_window(self, topic):
+        """Hours of news to request for topic: since its last successful fetch, at most NEWS_TIME_WINDOW"""
+        watermark = self.state.watermark(topic)
+        if watermark is None:
+            return NEWS_TIME_WINDOW
+        return max(1, min(NEWS_TIME_WINDOW, math.ceil((time.time() - watermark) / 3600)))
+
+    def _domain_params(self, topic=None):
+        """(request parameters, offloaded prompt text) for the sources trusted for topic
+
+        The source list only counts as offloaded from the prompt when search_domain_filter is sent.
+        """
+        key = topic if self.sources.has_allowlist(topic) else None
+        if key not in self._domain_filters:
+            domains = self.sources.domains(key)
+            sent = domain_filter(domains) if domains is not None else None
+            if sent is None:
+                self._domain_filters[key] = ({}, '')
+            else:
+                self._domain_filters[key] = ({'search_domain_filter': sent}, f"from these sources: {', '.join(domains)}")
+        return self._domain_filters[key]
+
+    @staticmethod
+    def _recency_filter(hours):
+        """Narrowest Perplexity search_recency_filter that still covers the window"""
+        if hours <= 1:
+            return 'hour'
+        if hours <= 24:
+            return 'day'
+        return 'week' if hours <= 24 * 7 else 'month'
+
+    def _search_structured(self, topics):
+        """Fetch verified, summarized articles for a batch of topics in a single request"""
+        if self.checkpoint is not None:
+            saved = [self.checkpoint.get(topic, 'articles') for topic in topics]
+            remaining = [topic for topic, output in zip(topics, saved) if output is None]
+            if len(remaining) < len(topics):
+                logger.debug("Resuming %s structured topics from checkpoint", len(topics) - len(remaining))
+                fresh = dict(zip(remaining, self._search_structured(remaining))) if remaining else {}
+                for topic, output in zip(topics, saved):
+                    if output is not None and output.get('started'):
+                        self._fetched_at[topic] = output['started']
+                return [output['articles'] if output is not None else fresh[topic]
+                        for topic, output in zip(topics, saved)]
+
+        logger.debug("Structured search for topics: %s", topics)
+        hours = max(self._search_window(topic) for topic in topics)
+        started = time.time()
+        params, offloaded = self._domain_params()
+        try:
+            with self.metrics.span('structured'):
+                result = self.perplexity.chat_completion(
+                    self.prompts.messages('structured', build_structured_query(topics, hours), offloaded=offloaded),
+                    stage='structured',
+                    response_format=response_format(),
+                    search_recency_filter=self._recency_filter(hours),
+                    **params
                 )
-                
-                print(f"[DEBUG] Perplexity API Response Status: {response.status_code}")
-                if response.status_code == 200:
-                    result = response.json()
-                    print(f"[DEBUG] Perplexity API Response: {json.dumps(result, indent=2)}")
-                    articles.extend(self._parse_perplexity_response(result, topic))
-                else:
-                    print(f"[DEBUG] Error response from Perplexity API: {response.text}")
-            except Exception as e:
-                print(f"[DEBUG] Error searching news for topic {topic}: {str(e)}")
-        
+            logger.debug("Structured API Response: %s", LazyJSON(result))
+            articles_by_topic = parse_structured_response(result, topics)
+            # A cached search only covers news up to when it was first made
+            fetched = result.get('cached_at', started)
+            results = []
+            for topic in topics:
+                self._fetched_at[topic] = fetched
+                articles = self._drop_seen(self.sources.filter_urls(articles_by_topic[topic], topic))
+                if self.checkpoint is not None:
+                    self.checkpoint.save(topic, 'articles', {'started': fetched, 'articles': articles})
+                results.append(articles)
+            return results
+        except StructuredOutputError as e:
+            logger.warning("Structured response failed validation, falling back to multi-stage: %s", e)
+        except PerplexityAPIError as e:
+            logger.warning("Error response from Perplexity API, falling back to multi-stage: %s", e.text)
+        except Exception as e:
+            logger.warning("Error in structured search for topics %s, falling back to multi-stage: %s", topics, e)
+        finally:
+            self.state.record_latencies(dict.fromkeys(topics, time.time() - started))
+        return [self._search_topic(topic) for topic in topics]
+
+    def _search_topic(self, topic):
+        """Search, verify and summarize news for a single topic"""
+        result = self._fetch_topic(topic)
+        if result is None:
+            return []
+        return self._topic_articles(topic, result)
+
+    def _fetch_topic(self, topic):
+        """Run the Perplexity news search for a single topic, returning None on failure"""
+        if self.checkpoint is not None:
+            saved = self.checkpoint.get(topic, 'search')
+            if saved is not None:
+                logger.debug("Resuming search for %s from checkpoint", topic)
+                self._fetched_at[topic] = saved['started']
+                return saved['response']
+
+        logger.debug("Searching news for topic: %s", topic)
+        hours = self._search_window(topic)
+        started = time.time()
+        query = f"Find recent news articles from the last {hours} hours about {topic}."
+        logger.debug("Perplexity API Query: %s", query)
+        params, offloaded = self._domain_params(topic)
+
+        try:
+            logger.debug("Making request to Perplexity API...")
+            with self.metrics.span('search'):
+                result = self.perplexity.chat_completion(
+                    self.prompts.messages('search', query, offloaded=offloaded),
+                    stage='search',
+                    on_chunk=(SearchStream(lambda results: self._prefetch_pages(topic, results))
+                              if self.page_fetcher is not None else None),
+                    search_recency_filter=self._recency_filter(hours),
+                    **params
+                )
+            logger.debug("Perplexity API Response: %s", LazyJSON(result))
+            # A cached search only covers news up to when it was first made
+            fetched = result.get('cached_at', started)
+            self._fetched_at[topic] = fetched
+            if self.checkpoint is not None:
+                self.checkpoint.save(topic, 'search', {'started': fetched, 'response': result})
+            return result
+        except PerplexityAPIError as e:
+            logger.warning("Error response from Perplexity API: %s", e.text)
+        except Exception as e:
+            logger.warning("Error searching news for topic %s: %s", topic, e)
+        finally:
+            # Failed and timed-out searches count too, so slow topics are started first less often
+            self.state.record_latencies({topic: time.time() - started})
+
+        return None
+
+    def _prefetch_pages(self, topic, search_results):
+        """Start fetching the pages of a search that is still streaming its answer"""
+        # Titles and snippets alone are enough to skip pages of clearly off-topic results
+        if self.relevance_filter is not None and self._prefilter([(topic, {'search_results': search_results})])[0][0] == REJECT:
+            return
+        urls = [result['url'] for result in self._select_results(search_results, topic)]
+        logger.debug("Prefetching %s pages while the search answer streams", len(urls))
+        self.page_fetcher.prefetch(urls)
+
+    def _drop_seen(self, articles):
+        """Remove articles whose URL was delivered in an earlier digest"""
+        if self.seen_index is None:
+            return articles
+        return [article for article in articles if article['url'] not in self.seen_index]
+
+    def _candidate_text(self, response):
+        """Collect the answer text and result titles/snippets used for local relevance scoring"""
+        parts = []
+        try:
+            parts.append(response['choices'][0]['message']['content'])
+        except (KeyError, IndexError, TypeError):
+            pass
+        for result in response.get('search_results') or []:
+            parts.extend(result.get(field) or '' for field in ('title', 'snippet'))
+        return '\n'.join(part for part in parts if part)
+
+    def _prefilter(self, found):
+        """Locally classify (topic, response) pairs as accept, reject or ambiguous"""
+        if self.relevance_filter is None:
+            return [None] * len(found)
+        return self.relevance_filter.classify(
+            [(self._candidate_text(response), topic) for topic, response in found]
+        )
+
+    def _topic_articles(self, topic, response, verdict=None):
+        """Extract a topic's articles, reusing or saving the run checkpoint for this stage"""
+        if self.checkpoint is not None:
+            saved = self.checkpoint.get(topic, 'articles')
+            if saved is not None:
+                logger.debug("Resuming articles for %s from checkpoint", topic)
+                if saved.get('started'):
+                    self._fetched_at[topic] = saved['started']
+                return saved['articles']
+        try:
+            articles = self._extract_articles(response, topic, verdict)
+        except Exception as e:
+            # Not checkpointed, so a resumed run retries this topic
+            logger.warning("Error parsing response: %s", e)
+            return []
+        if self.checkpoint is not None:
+            self.checkpoint.save(topic, 'articles', {'started': self._fetched_at.get(topic), 'articles': articles})
         return articles
 
-    def _parse_perplexity_response(self, response, topic):
-        """Parse the Perplexity API response and extract relevant articles"""
+    def _extract_articles(self, response, topic, verdict=None):
+        """Verify and summarize the articles in a search response, raising on API errors"""
         articles = []
-        try:
-            print(f"\n[DEBUG] Parsing Perplexity response for topic: {topic}")
-            content = response['choices'][0]['message']['content']
-            print(f"[DEBUG] Extracted content: {content[:200]}...")
-            
-            # Extract URLs from search_results
-            urls = []
-            if 'search_results' in response:
-                for result in response['search_results']:
-                    if 'url' in result and result['url']:
-                        # Check if the URL is from a trusted source
-                        url = result['url']
-                        #if any(source in url.lower() for source in [s.lower() for s in TRUSTED_SOURCES]):
-                        urls.append(url)
-                        #    print(f"[DEBUG] Found URL from trusted source: {url}")
-                        #else:
-                        #    print(f"[DEBUG] Skipping URL from untrusted source: {url}")
-                print(f"[DEBUG] Found {len(urls)} URLs from trusted sources")
-            
-            if not urls:
-                print("[DEBUG] No articles found from trusted sources")
+        logger.debug("Parsing Perplexity response for topic: %s", topic)
+        content = response['choices'][0]['message']['content']
+        logger.debug("Extracted content: %s...", content[:200])
+        
+        results = self._select_results(response.get('search_results', []), topic)
+        if not results:
+            logger.debug("No articles found from trusted sources")
+            return articles
+        
+        if verdict is None and self.relevance_filter is not None:
+            verdict = self._prefilter([(topic, response)])[0]
+        if verdict is not None:
+            logger.debug("Local relevance pre-filter: %s (score %.3f)", verdict[0], verdict[1])
+            if verdict[0] == REJECT:
                 return articles
-            
+
+        # Only a topic accepted by the local score alone has its candidates screened locally;
+        # once the LLM has judged the topic relevant its verdict stands
+        screen = verdict is not None and verdict[0] == ACCEPT
+        if screen:
+            relevant = True
+        else:
             # Use Perplexity to verify relevance
-            verification_query = f"Verify if this article is highly relevant to {topic}: {content}"
-            print(f"[DEBUG] Making verification request to Perplexity API...")
-            verification_response = requests.post(
-                'https://api.perplexity.ai/chat/completions',
-                headers=self.headers,
-                json={
-                    'model': 'sonar',
-                    'messages': [{'role': 'user', 'content': verification_query}]
-                }
-            )
-            
-            print(f"[DEBUG] Verification Response Status: {verification_response.status_code}")
-            if verification_response.status_code == 200:
-                verification_result = verification_response.json()
-                print(f"[DEBUG] Verification Response: {json.dumps(verification_result, indent=2)}")
-                if self._is_relevant(verification_result):
-                    article = {
-                        'title': self._extract_title(content),
-                        'url': urls[0],  # Use the first trusted source URL
-                        'summary': self._generate_summary(content),
-                        'topic': topic
-                    }
-                    print(f"[DEBUG] Created article: {json.dumps(article, indent=2)}")
-                    articles.append(article)
-        except Exception as e:
-            print(f"[DEBUG] Error parsing response: {str(e)}")
-        
+            logger.debug("Making verification request to Perplexity API...")
+            with self.metrics.span('verify'):
+                verification_result = self.perplexity.chat_completion(
+                    self.prompts.messages('verify', f"Verify if this article is highly relevant to {topic}:", content),
+                    stage='verify'
+                )
+            logger.debug("Verification Response: %s", LazyJSON(verification_result))
+            with self.metrics.span('relevance'):
+                relevant = self._is_relevant(topic, verification_result)
+
+        if relevant:
+            # Summarize each candidate as soon as its page arrives, then restore search order
+            created = []
+            for index, candidate in self._iter_candidates(results):
+                article = self._create_article(candidate, content, topic, index, screen)
+                if article is not None:
+                    created.append((index, article))
+            articles.extend(article for _, article in sorted(created, key=lambda item: item[0]))
+
         return articles
 
-    def _is_relevant(self, verification_result):
-        """Determine if an article is relevant based on semantic similarity"""
-        print(f"[DEBUG] Checking relevance with result: {json.dumps(verification_result, indent=2)}")
+    def _select_results(self, search_results, topic):
+        """Pick the search results worth turning into articles: trusted, not delivered before, capped"""
+        # Keep URLs from trusted sources, highest weighted sources first
+        results = []
+        if search_results:
+            results = self.sources.filter_urls(search_results, topic)
+            logger.debug("Found %s URLs from trusted sources, skipped %s", len(results), len(search_results) - len(results))
+
+        # Skip articles already delivered in a previous digest before paying for verification or summaries
+        if self.seen_index is not None and results:
+            unseen = [result for result in results if result['url'] not in self.seen_index]
+            if len(unseen) < len(results):
+                logger.debug("Skipping %s previously delivered URLs", len(results) - len(unseen))
+            results = unseen
+        
+        return results[:MAX_ARTICLES_PER_TOPIC]
+
+    def _iter_candidates(self, results):
+        """Yield (index, candidate) for each search result as its page is fetched and parsed"""
+        if self.page_fetcher is None:
+            for index, result in enumerate(results):
+                yield index, {'url': result['url'], 'title': result.get('title'), 'lead': result.get('snippet')}
+            return
+
+        for index, url, page in self.page_fetcher.fetch_all([result['url'] for result in results]):
+            page = page or {}
+            yield index, {
+                'url': url,
+                'title': page.get('title') or results[index].get('title'),
+                'lead': page.get('lead') or results[index].get('snippet')
+            }
+
+    def _create_article(self, candidate, content, topic, index=None, screen=True):
+        """Turn a fetched candidate into an article, or None if its own text is off-topic
+
+        screen scores the candidate's own text with the local pre-filter and drops it on a
+        reject; it is off for topics the LLM relevance check already accepted.
+
+        index is the candidate's position in its topic's search results. With the topic's
+        position in the search it ranks the candidate among near-duplicates, so the copy
+        that is kept does not depend on which thread gets there first.
+        """
+        lead = candidate['lead']
+        score = None
+        if screen and lead and self.relevance_filter is not None:
+            verdict, score = self.relevance_filter.classify([(f"{candidate['title'] or ''}\n{lead}", topic)])[0]
+            if verdict == REJECT:
+                logger.debug("Dropping off-topic candidate %s (score %.3f)", candidate['url'], score)
+                return None
+
+        if self.stories is not None:
+            rank = (self._topic_order.get(topic, len(self._topic_order)), index) if index is not None else None
+            original = self.stories.add(f"{candidate['title'] or ''}\n{lead or ''}", candidate['url'], topic, rank)
+            if original is not None:
+                logger.debug("Not summarizing %s, a near-duplicate of %s", candidate['url'], original)
+                self.metrics.increment('duplicates_skipped')
+                return None
+
+        article = {
+            'title': candidate['title'] or self._extract_title(content),
+            'url': candidate['url'],
+            'summary': self._generate_summary(lead or content),
+            'topic': topic
+        }
+        if score is not None:
+            article['relevance_score'] = round(float(score), 3)
+        logger.debug("Created article: %s", LazyJSON(article))
+        return article
+
+    def _is_relevant(self, topic, verification_result):
+        """Determine if an article is relevant to topic based on semantic similarity"""
+        logger.debug("Checking relevance to %s with result: %s", topic, LazyJSON(verification_result))
         try:
-            # Extract the verification content and topic
             content = verification_result['choices'][0]['message']['content']
-            topic = content.split('Verify if this article is highly relevant to ')[1].split(':')[0].strip()
-            
-            # Use Perplexity to analyze semantic relevance
-            similarity_query = f"""Analyze if this article is semantically relevant to the topic of {topic}.
-            Consider:
-            1. Main themes and concepts
-            2. Direct and indirect relationships
-            3. Depth of coverage
-            4. Context and implications
-            
-            Article content: {content}
-            
-            Respond with a JSON object containing:
-            {{
-                "relevance_score": float (0-1),
-                "reasoning": "explanation of the relevance",
-                "key_themes": ["list", "of", "main", "themes"],
-                "is_relevant": boolean
-            }}"""
             
-            print(f"[DEBUG] Making semantic similarity request to Perplexity API...")
-            similarity_response = requests.post(
-                'https://api.perplexity.ai/chat/completions',
-                headers=self.headers,
-                json={
-                    'model': 'sonar',
-                    'messages': [{'role': 'user', 'content': similarity_query}]
-                }
+            # Use Perplexity to analyze semantic relevance of themes, relationships, depth and context
+            # The verdict fields come first so a streamed response can be cut off once they arrive
+            similarity_instruction = (
+                f"Analyze if this article is semantically relevant to the topic of {topic}, considering its "
+                "main themes, direct and indirect relationships, depth of coverage and implications. "
+                'Respond with JSON: {"relevance_score": 0-1, "is_relevant": boolean, "reasoning": string, '
+                '"key_themes": [string]}. Article:'
             )
             
-            if similarity_response.status_code == 200:
-                similarity_result = similarity_response.json()
-                analysis = similarity_result['choices'][0]['message']['content']
-                
-                try:
-                    # Parse the JSON response
-                    analysis_json = json.loads(analysis)
-                    
-                    print(f"[DEBUG] Semantic analysis results:")
-                    print(f"- Relevance score: {analysis_json.get('relevance_score', 0)}")
-                    print(f"- Reasoning: {analysis_json.get('reasoning', 'No reasoning provided')}")
-                    print(f"- Key themes: {analysis_json.get('key_themes', [])}")
-                    print(f"- Is relevant: {analysis_json.get('is_relevant', False)}")
-                    
-                    # Consider an article relevant if:
-                    # 1. The relevance score is above 0.6, or
-                    # 2. The analysis explicitly states it's relevant
-                    is_relevant = analysis_json.get('relevance_score', 0) > 0.6 or analysis_json.get('is_relevant', False)
-                    
-                    return is_relevant
-                    
-                except json.JSONDecodeError:
-                    print("[DEBUG] Failed to parse JSON response from semantic analysis")
-                    # Fallback to basic relevance check if JSON parsing fails
-                    return 'relevant' in analysis.lower() or 'related' in analysis.lower()
-            else:
-                print(f"[DEBUG] Error in semantic similarity request: {similarity_response.text}")
+            logger.debug("Making semantic similarity request to Perplexity API...")
+            try:
+                similarity_result = self.perplexity.chat_completion(
+                    self.prompts.messages('relevance', similarity_instruction, content),
+                    stage='relevance',
+                    on_chunk=lambda text, chunk: relevance_verdict(text) is not None
+                )
+            except PerplexityAPIError as e:
+                logger.warning("Error in semantic similarity request: %s", e.text)
                 return True  # Default to True if API call fails
+
+            analysis = similarity_result['choices'][0]['message']['content']
+            if similarity_result.get('cancelled'):
+                logger.debug("Relevance verdict resolved from a partial analysis: %s", analysis)
+                return relevance_verdict(analysis)
+            
+            try:
+                # Parse the JSON response
+                analysis_json = json.loads(analysis)
+                
+                logger.debug("Semantic analysis results: relevance score %s, is relevant %s, key themes %s, reasoning: %s",
+                             analysis_json.get('relevance_score', 0), analysis_json.get('is_relevant', False),
+                             analysis_json.get('key_themes', []), analysis_json.get('reasoning', 'No reasoning provided'))
+                
+                # Consider an article relevant if:
+                # 1. The relevance score is above 0.6, or
+                # 2. The analysis explicitly states it's relevant
+                is_relevant = analysis_json.get('relevance_score', 0) > 0.6 or analysis_json.get('is_relevant', False)
+                
+                return is_relevant
                 
+            except json.JSONDecodeError:
+                logger.warning("Failed to parse JSON response from semantic analysis")
+                # Fallback to basic relevance check if JSON parsing fails
+                return 'relevant' in analysis.lower() or 'related' in analysis.lower()
+
         except Exception as e:
-            print(f"[DEBUG] Error in semantic relevance check: {str(e)}")
+            logger.warning("Error in semantic relevance check: %s", e)
             return True  # Default to True in case of errors
 
     def _extract_title(self, content):
         """Extract article title from content"""
-        print(f"[DEBUG] Extracting title from content: {content[:100]}...")
+        logger.debug("Extracting title from content: %s...", content[:100])
         try:
             # Look for title patterns in the content
             # Common patterns: "Title:", "Headline:", or first line of content
@@ -237,18 +649,18 @@ class NewsAggregator:
                 if match:
                     title = match.group(1).strip()
                     if title and len(title) > 5:  # Basic validation
-                        print(f"[DEBUG] Found title: {title}")
+                        logger.debug("Found title: %s", title)
                         return title
             
-            print("[DEBUG] No title found in content")
+            logger.debug("No title found in content")
             return "Title not found"
         except Exception as e:
-            print(f"[DEBUG] Error extracting title: {str(e)}")
+            logger.warning("Error extracting title: %s", e)
             return "Title extraction failed"
 
     def _extract_url(self, content):
         """Extract article URL from content"""
-        print(f"[DEBUG] Extracting URL from content: {content[:100]}...")
+        logger.debug("Extracting URL from content: %s...", content[:100])
         try:
             # Look for URLs in the content
             # Common patterns: "from [url]", "source: [url]", "read more: [url]", or just a plain URL
@@ -263,87 +675,40 @@ class NewsAggregator:
                 match = re.search(pattern, content, re.IGNORECASE)
                 if match:
                     url = match.group(1).strip('.,;:!?')
-                    print(f"[DEBUG] Found URL: {url}")
+                    logger.debug("Found URL: %s", url)
                     return url
             
-            print("[DEBUG] No URL found in content")
+            logger.debug("No URL found in content")
             return "URL not found"
         except Exception as e:
-            print(f"[DEBUG] Error extracting URL: {str(e)}")
+            logger.warning("Error extracting URL: %s", e)
             return "URL extraction failed"
 
     def _generate_summary(self, content):
         """Generate a summary of the article using Perplexity"""
         try:
-            print(f"\n[DEBUG] Generating summary for content: {content[:100]}...")
-            response = requests.post(
-                'https://api.perplexity.ai/chat/completions',
-                headers=self.headers,
-                json={
-                    'model': 'sonar',
-                    'messages': [{'role': 'user', 'content': f"Summarize this article in 2-3 sentences: {content}"}]
-                }
-            )
-            
-            print(f"[DEBUG] Summary API Response Status: {response.status_code}")
-            if response.status_code == 200:
-                result = response.json()
-                print(f"[DEBUG] Summary API Response: {json.dumps(result, indent=2)}")
-                return result['choices'][0]['message']['content']
+            logger.debug("Generating summary for content: %s...", content[:100])
+            with self.metrics.span('summary'):
+                result = self.perplexity.chat_completion(
+                    self.prompts.messages('summary', "Summarize this article in 2-3 sentences:", content),
+                    stage='summary'
+                )
+            logger.debug("Summary API Response: %s", LazyJSON(result))
+            return result['choices'][0]['message']['content']
         except Exception as e:
-            print(f"[DEBUG] Error generating summary: {str(e)}")
+            logger.warning("Error generating summary: %s", e)
         return "Summary not available"
 
     def send_digest(self, articles):
-        """Send email digest with article summaries."""
+        """Send email digest with article summaries. Returns True if the email was sent."""
         if not articles:
-            print("[DEBUG] No articles to send")
-            return
+            logger.debug("No articles to send")
+            return False
 
-        print(f"[DEBUG] Preparing to send email with {len(articles)} articles")
+        logger.debug("Preparing to send email with %s articles", len(articles))
         
-        # Create HTML email content
-        html_content = """
-        <html>
-        <head>
-            <style>
-                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
-                .article { margin-bottom: 30px; padding-bottom: 20px; border-bottom: 1px solid #eee; }
-                .topic { font-weight: bold; color: #2c3e50; font-size: 1.2em; }
-                .title { font-size: 1.1em; margin: 10px 0; }
-                .summary { margin: 10px 0; }
-                .source { color: #3498db; text-decoration: none; }
-                .source:hover { text-decoration: underline; }
-            </style>
-        </head>
-        <body>
-            <h2>Today's News Digest</h2>
-        """
-        
-        for article in articles:
-            print(f"[DEBUG] Processing article: {article}")
-            html_content += f"""
-            <div class="article">
-                <div class="topic">Topic: {article['topic']}</div>
-                <div class="title">{article['title']}</div>
-                <div class="summary">{article['summary']}</div>
-                <a href="{article['url']}" class="source">Source</a>
-            </div>
-            """
-
-        html_content += """
-        </body>
-        </html>
-        """
-
-        # Create plain text version for email clients that don't support HTML
-        plain_content = "Here are today's relevant news articles:\n\n"
-        for article in articles:
-            plain_content += f"Topic: {article['topic']}\n"
-            plain_content += f"Title: {article['title']}\n"
-            plain_content += f"Summary: {article['summary']}\n"
-            plain_content += f"Source: {article['url']}\n\n"
-            plain_content += "-" * 80 + "\n\n"
+        with self.metrics.span('render'):
+            html_content, plain_content = self.renderer.render(articles)
 
         # Create and send the email
         try:
@@ -355,40 +720,325 @@ class NewsAggregator:
                 plain_content
             )
             
-            print("[DEBUG] Sending email via Gmail API...")
-            sent_message = self.gmail_service.users().messages().send(
-                userId='me',
-                body=message
-            ).execute()
+            logger.debug("Sending email via Gmail API...")
+            with self.metrics.span('send'):
+                sent_message = self.gmail_service.users().messages().send(
+                    userId='me',
+                    body=message
+                ).execute()
             
-            print(f"[DEBUG] Email sent successfully! Message ID: {sent_message['id']}")
+            logger.info("Email sent successfully! Message ID: %s", sent_message['id'])
+            return True
+        except Exception as e:
+            logger.warning("Error sending email: %s", e)
+            return False
+
+    def _send_messages(self, messages):
+        """Send encoded messages through batched Gmail requests, returning a success flag per message"""
+        import httplib2
+        from google_auth_httplib2 import AuthorizedHttp
+
+        results = [False] * len(messages)
+        # Built here rather than on first use inside the batch threads, which could each refresh the token
+        service = self.gmail_service
+        size = max(1, min(GMAIL_BATCH_SIZE, 100))
+        batches = [list(range(start, min(start + size, len(messages))))
+                   for start in range(0, len(messages), size)]
+
+        def send_batch(indexes):
+            def callback(request_id, response, exception):
+                index = int(request_id)
+                if exception is not None:
+                    logger.warning("Error sending email to %s: %s", messages[index]['to'], exception)
+                else:
+                    results[index] = True
+                    logger.info("Email sent successfully! Message ID: %s", response['id'])
+
+            batch = service.new_batch_http_request(callback=callback)
+            for index in indexes:
+                batch.add(service.users().messages().send(userId='me', body=messages[index]['body']),
+                          request_id=str(index))
+            # httplib2 connections are not thread-safe, so each batch gets its own
+            http = httplib2.Http(timeout=GMAIL_TIMEOUT)
+            if self.gmail_credentials is not None:
+                http = AuthorizedHttp(self.gmail_credentials, http=http)
+            try:
+                with self.metrics.span('send'):
+                    batch.execute(http=http)
+            except Exception as e:
+                logger.warning("Error sending batch of %s emails: %s", len(indexes), e)
+
+        logger.info("Sending %s emails in %s batches via Gmail API...", len(messages), len(batches))
+        with ThreadPoolExecutor(max_workers=max(1, GMAIL_SEND_CONCURRENCY)) as executor:
+            list(executor.map(send_batch, batches))
+        return results
+
+    def send_subscriber_digests(self, articles, stage='sent', subject='Daily News Digest', earlier=()):
+        """Send each subscriber a digest of their topics
+
+        Returns (delivered_urls, complete), where complete is False if any email failed.
+        Subscribers already sent to by a resumed run are skipped; stage names the checkpoint
+        that records this, so a follow-up email is tracked apart from the main digest.
+        earlier are articles sent before in this run, which a subscriber who got them is not sent again.
+        """
+        delivered = []
+        by_topic = {}
+        for article in articles:
+            by_topic.setdefault(article['topic'], []).append(article)
+        earlier_by_topic = {}
+        for article in earlier:
+            earlier_by_topic.setdefault(article['topic'], []).append(article)
+
+        subject = f'{subject} - {datetime.now().strftime("%Y-%m-%d")}'
+        messages = []
+        for subscriber in self.subscribers:
+            if self.checkpoint is not None:
+                saved = self.checkpoint.get(subscriber.email, stage)
+                if saved is not None:
+                    logger.debug("Digest for %s already sent in this run", subscriber.email)
+                    delivered.extend(saved['urls'])
+                    continue
+            listed = {article['url'] for topic in subscriber.topics for article in earlier_by_topic.get(topic, [])}
+            sections = self._subscriber_sections(subscriber, by_topic, listed)
+            if not sections:
+                logger.debug("No articles for %s", subscriber.email)
+                continue
+            # Sections shared between subscribers are rendered once and reused from the renderer cache
+            with self.metrics.span('render'):
+                html_content, plain_content = self.renderer.render_sections(sections)
+            messages.append({
+                'to': subscriber.email,
+                'urls': [url for _, topic_articles in sections for article in topic_articles
+                         for url in [article['url']] + article.get('alternates', [])],
+                'body': self._create_message(EMAIL_SENDER, subscriber.email, subject, html_content, plain_content)
+            })
+
+        if not messages:
+            logger.debug("No articles to send")
+            return list(dict.fromkeys(delivered)), True
+        results = self._send_messages(messages)
+        self.metrics.increment('emails_sent', sum(results))
+        self.metrics.increment('emails_failed', len(results) - sum(results))
+        for message, sent in zip(messages, results):
+            if sent:
+                delivered.extend(message['urls'])
+                if self.checkpoint is not None:
+                    self.checkpoint.save(message['to'], stage, {'urls': message['urls']})
+        return list(dict.fromkeys(delivered)), all(results)
+
+    @staticmethod
+    def _subscriber_sections(subscriber, by_topic, listed=None):
+        """(topic, articles) sections for a subscriber, listing a story found under several topics once
+
+        listed holds URLs the subscriber already has; an article whose URL or an alternate is
+        among them is left out.
+        """
+        sections = []
+        listed = set(listed or ())
+        for topic in subscriber.topics:
+            articles = [article for article in by_topic.get(topic, [])
+                        if article['url'] not in listed and listed.isdisjoint(article.get('alternates', ()))]
+            listed.update(article['url'] for article in articles)
+            if articles:
+                sections.append((topic, articles))
+        return sections
+
+    def _commit_watermarks(self, topics):
+        """Advance the fetch watermark of every topic in topics that was fetched successfully"""
+        self.state.set_watermarks({topic: self._fetched_at.pop(topic)
+                                   for topic in topics if topic in self._fetched_at})
+
+    def _send_follow_up(self, late, on_time):
+        """Send the articles of late topics to their subscribers once the topics finish
+
+        on_time are the articles of the main digest. Returns True if every follow-up email was sent.
+        """
+        with self.metrics.span('late'):
+            articles = self._finish_late(late, on_time)
+        logger.info("Late topics found %s articles", len(articles))
+        self._archive(articles)
+        self.metrics.increment('articles', len(articles))
+        delivered, complete = self.send_subscriber_digests(articles, stage='follow_up',
+                                                           subject='Daily News Digest Update', earlier=on_time)
+        self._record_delivery(delivered)
+        if delivered or not articles:
+            self._commit_watermarks([topic for unit, _ in late for topic in unit])
+        return complete
+
+    def _record_delivery(self, delivered):
+        """Mark delivered URLs as seen and as sent in the archive"""
+        if not delivered:
+            return
+        if self.seen_index is not None:
+            self.seen_index.add_many(delivered)
+        if self.archive is not None:
+            self.archive.mark_sent(delivered)
+
+    def _archive(self, articles):
+        """Keep accepted articles in the archive; a failed write never holds up delivery"""
+        if self.archive is None:
+            return
+        try:
+            with self.metrics.span('archive'):
+                self.archive.add(articles)
         except Exception as e:
-            print(f"[DEBUG] Error sending email: {str(e)}")
+            logger.warning("Error archiving articles: %s", e)
+
+    def refresh_topics(self, topics):
+        """Collect new articles for topics between digests and hold them for the next digest"""
+        logger.info("Refreshing %s topics", len(topics))
+        self._fetched_at.clear()
+        articles = self.search_news(topics)
+        self._archive(articles)
+        self.state.add_pending(articles)
+        self._commit_watermarks(topics)
+        logger.info("Collected %s articles for the next digest", len(articles))
+
+    def run_daily_digest(self, run_id=None, search=None):
+        """Run the daily news digest process, resuming an interrupted run if there is one
+
+        search(topics, run_id) replaces the in-process search, for example to fan it out to workers.
+        """
+        self.metrics.reset()
+        self._fetched_at.clear()
+        logger.info("Running daily digest at %s", datetime.now())
+        if CHECKPOINT_ENABLED:
+            run_id, resumed = self.state.begin_run(run_id)
+            self.checkpoint = RunCheckpoint(self.state, run_id)
+            if resumed:
+                logger.info("Resuming run %s from %s checkpoints", run_id, len(self.checkpoint))
+            else:
+                logger.info("Starting run %s", run_id)
+        elif run_id is None:
+            run_id = new_run_id()
+        try:
+            self._run_digest(run_id, search)
+        finally:
+            self.checkpoint = None
+
+    def _run_digest(self, run_id, search=None):
+        """Search, deliver and record one digest"""
+        started = time.time()
+        # Each unique topic is searched once and shared by every subscriber following it
+        topics = self.subscribers.topics()
+        logger.info("Fetching %s topics for %s subscribers", len(topics), len(self.subscribers))
+        pending_ids, pending = self.state.pending_articles()
+        saved = self.checkpoint.get('digest', 'articles') if self.checkpoint is not None else None
+        late = []
+        if saved is not None:
+            # Duplicate clusters only exist in memory, so a resumed delivery reuses the merged list
+            articles = saved['articles']
+            self._fetched_at.update(saved['fetched_at'])
+            late = [(unit, None) for unit in saved.get('late', [])]
+            # The index that clustered the saved articles is gone; late topics are clustered afresh
+            self.stories = StoryIndex() if DEDUP_ENABLED else None
+        else:
+            if search is not None:
+                articles = search(topics, run_id)
+            elif DIGEST_DEADLINE_SECONDS > 0:
+                articles, late = self.search_until(topics, started + DIGEST_DEADLINE_SECONDS)
+            else:
+                articles = self.search_news(topics)
+            self._archive(articles)
+        late_topics = {topic for unit, _ in late for topic in unit}
+        on_time = [topic for topic in topics if topic not in late_topics]
+        if saved is None and self.checkpoint is not None:
+            # Late searches still running update _fetched_at, so only on-time topics are copied
+            self.checkpoint.save('digest', 'articles', {
+                'articles': articles,
+                'fetched_at': {topic: self._fetched_at[topic] for topic in on_time if topic in self._fetched_at},
+                'late': [unit for unit, _ in late]
+            })
+        logger.info("Found %s articles", len(articles))
+        if pending:
+            logger.info("Including %s articles collected since the last digest", len(pending))
+            urls = {article['url'] for article in articles}
+            articles = [article for article in pending if article['url'] not in urls] + articles
+        self.metrics.increment('topics', len(topics))
+        self.metrics.increment('articles', len(articles))
+        delivered, complete = self.send_subscriber_digests(articles)
+        self._record_delivery(delivered)
+        if delivered or not articles:
+            # Only move the fetch windows forward once their articles have gone out
+            self._commit_watermarks(on_time)
+            self.state.clear_pending(pending_ids)
+        if late:
+            self.metrics.increment('late_topics', len(late_topics))
+            if LATE_TOPIC_POLICY == 'drop':
+                # Their watermarks stay put, so the next digest searches their window again
+                logger.info("Leaving %s late topics out of this digest", len(late_topics))
+            else:
+                complete = self._send_follow_up(late, articles) and complete
+        if complete and self.checkpoint is not None:
+            self.state.complete_run(self.checkpoint.run_id)
+
+        for stage, stats in self.perplexity.latency_stats().items():
+            logger.debug("Perplexity %s: %s calls, p50 %.2fs, p95 %.2fs, max %.2fs",
+                         stage, stats['count'], stats['p50'], stats['p95'], stats['max'])
+        if self.cache is not None:
+            stats = self.cache.stats()
+            logger.info("Completion cache: %s hits, %s misses, %s entries (%s bytes)",
+                        stats['hits'], stats['misses'], stats['entries'], stats['bytes'])
+        self.metrics.log_summary()
+        try:
+            self.metrics.write()
+        except OSError as e:
+            logger.warning("Error writing run metrics: %s", e)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Aggregate news with Perplexity and email daily digests.')
+    parser.add_argument('--once', action='store_true',
+                        help='run a single digest and exit, deferring Gmail client setup until send time')
+    parser.add_argument('--coordinate', action='store_true',
+                        help='run a single digest as queued jobs shared with worker processes, then exit')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='with --coordinate, number of local worker processes to start')
+    parser.add_argument('--worker', action='store_true',
+                        help='process jobs queued by a coordinator')
+    parser.add_argument('--exit-when-idle', action='store_true',
+                        help='with --worker, exit once the queue has no unfinished jobs')
+    parser.add_argument('--run-id',
+                        help='with --once or --coordinate, resume the checkpointed run with this id instead of '
+                             'the latest unfinished one; with --worker, only process jobs of this run')
+    return parser.parse_args(argv)
 
-    def run_daily_digest(self):
-        """Run the daily news digest process"""
-        print(f"\n[DEBUG] Running daily digest at {datetime.now()}")
-        articles = self.search_news(DEFAULT_TOPICS)
-        print(f"[DEBUG] Found {len(articles)} articles")
-        self.send_digest(articles)
 
-def main():
-    print("[DEBUG] Starting News Aggregator application")
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging()
+
+    if args.once:
+        imported = time.perf_counter()
+        aggregator = NewsAggregator(lazy_gmail=True)
+        initialized = time.perf_counter()
+        logger.info("Startup: imports %.3fs, initialization %.3fs",
+                    imported - _IMPORT_STARTED, initialized - imported)
+        aggregator.run_daily_digest(args.run_id)
+        return
+
+    if args.coordinate:
+        aggregator = NewsAggregator(lazy_gmail=True)
+        Coordinator(aggregator, JobQueue(), workers=args.workers).run(args.run_id)
+        return
+
+    if args.worker:
+        # Workers never send mail, so no subscribers or Gmail client are needed
+        aggregator = NewsAggregator(subscribers=SubscriberRegistry([]), lazy_gmail=True)
+        Worker(aggregator, JobQueue()).run(args.run_id, exit_when_idle=args.exit_when_idle)
+        aggregator.metrics.log_summary()
+        return
+
+    logger.info("Starting News Aggregator application")
     aggregator = NewsAggregator()
-    
-    # Schedule the daily digest to run at 8 AM
-    print("[DEBUG] Scheduling daily digest for 8:00 AM")
-    schedule.every().day.at("08:00").do(aggregator.run_daily_digest)
-    
-    # Run immediately on startup
-    print("[DEBUG] Running initial digest")
-    aggregator.run_daily_digest()
-    
-    # Keep the script running
-    print("[DEBUG] Entering main loop")
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
+
+    # Send the digest daily at DIGEST_TIME and refresh fast-moving topics in between,
+    # running the first digest immediately on startup
+    logger.info("Scheduling daily digest for %s", DIGEST_TIME)
+    scheduler = TopicScheduler(aggregator)
+    try:
+        asyncio.run(scheduler.run_forever(run_immediately=True))
+    except KeyboardInterrupt:
+        logger.info("Stopping News Aggregator application")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
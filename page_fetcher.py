@@ -0,0 +1,222 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import *
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'Mozilla/5.0 (compatible; NewsAggregator/1.0)'
+_CHARSET = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+
+
+def header_charset(content_type):
+    """Return the charset named in a Content-Type header, or None if it has none"""
+    match = _CHARSET.search(content_type or '')
+    return match.group(1) if match else None
+
+
+def _body_chunks(response, size):
+    """Yield a streamed response body in chunks of at most size bytes as they arrive
+
+    iter_content fills each chunk before returning it, so a server trickling bytes could hold
+    a single read open well past the fetch deadline. urllib3 2.3+ can return what has arrived.
+    """
+    read1 = getattr(response.raw, 'read1', None)
+    if read1 is None:
+        yield from response.iter_content(chunk_size=size)
+        return
+    while True:
+        chunk = read1(size, decode_content=True)
+        if not chunk:
+            return
+        yield chunk
+
+
+class PageFetcher:
+    """Concurrent, size-capped article page fetcher with per-host connection limits"""
+
+    def __init__(self, max_workers=PAGE_FETCH_WORKERS, per_host=PAGE_FETCH_PER_HOST,
+                 max_bytes=PAGE_FETCH_MAX_BYTES, timeout=PAGE_FETCH_TIMEOUT,
+                 deadline=PAGE_FETCH_DEADLINE, metrics=None):
+        self.per_host = per_host
+        self.metrics = metrics
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.deadline = deadline
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='page-fetch')
+        # Fetches waiting for a free connection to their host, and the number running per host.
+        # Waiting fetches stay queued here rather than holding a pool thread.
+        self._host_queues = {}
+        self._host_active = {}
+        self._host_lock = threading.Lock()
+        # Downloads started by prefetch, waiting to be picked up by fetch_all
+        self._prefetched = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=per_host)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'User-Agent': USER_AGENT, 'Accept': 'text/html,application/xhtml+xml'})
+
+    def _submit(self, url):
+        """Queue a fetch behind its host's running fetches and return its future"""
+        host = urlsplit(url).hostname or ''
+        future = Future()
+        with self._host_lock:
+            self._host_queues.setdefault(host, deque()).append((url, future))
+        self._dispatch(host)
+        return future
+
+    def _dispatch(self, host):
+        """Start queued fetches for host while it has fewer than per_host running"""
+        with self._host_lock:
+            queue = self._host_queues.get(host)
+            jobs = []
+            while queue and self._host_active.get(host, 0) < self.per_host:
+                jobs.append(queue.popleft())
+                self._host_active[host] = self._host_active.get(host, 0) + 1
+            if not queue:
+                self._host_queues.pop(host, None)
+        for url, future in jobs:
+            try:
+                self.executor.submit(self._run, host, url, future)
+            except RuntimeError:  # Closed
+                future.cancel()
+
+    def _run(self, host, url, future):
+        try:
+            # Fetches cancelled while queued, such as dropped prefetches, are skipped
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(self.fetch(url))
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            with self._host_lock:
+                self._host_active[host] -= 1
+                if not self._host_active[host]:
+                    del self._host_active[host]
+            self._dispatch(host)
+
+    def fetch(self, url):
+        """Download at most max_bytes of a page and return its title and lead text, or None"""
+        if self.metrics is None:
+            return self._fetch(url)
+        with self.metrics.span('fetch'):
+            return self._fetch(url)
+
+    def _fetch(self, url):
+        # The read timeout applies to each chunk, so the download as a whole is cut off at the deadline
+        deadline = time.monotonic() + self.deadline
+        try:
+            with self.session.get(url, timeout=self.timeout, stream=True) as response:
+                if response.status_code != 200:
+                    logger.debug("Page fetch for %s returned %s", url, response.status_code)
+                    return None
+                content_type = response.headers.get('Content-Type', 'text/html')
+                if 'html' not in content_type:
+                    logger.debug("Skipping non-HTML page: %s", url)
+                    return None
+                body = bytearray()
+                for chunk in _body_chunks(response, 16384):
+                    body.extend(chunk)
+                    if len(body) >= self.max_bytes:
+                        break
+                    if time.monotonic() >= deadline:
+                        logger.debug("Page fetch for %s hit the %.0fs deadline after %s bytes", url, self.deadline, len(body))
+                        break
+                # requests assumes ISO-8859-1 for text/html without a charset, which would override
+                # the page's own <meta charset>; only an explicit header charset is passed on
+                encoding = header_charset(content_type)
+        except requests.RequestException as e:
+            logger.warning("Error fetching page %s: %s", url, e)
+            return None
+        return parse_page(bytes(body[:self.max_bytes]), encoding)
+
+    def prefetch(self, urls):
+        """Start downloading pages in the background so a later fetch_all finds them in flight"""
+        with self._lock:
+            for url in urls:
+                if url not in self._prefetched:
+                    self._prefetched[url] = self._submit(url)
+            # Prefetches that are never collected, such as for rejected topics, are dropped oldest first
+            while len(self._prefetched) > PAGE_PREFETCH_LIMIT:
+                self._prefetched.popitem(last=False)[1].cancel()
+
+    def fetch_all(self, urls):
+        """Fetch pages concurrently, yielding (index, url, page) tuples as each one completes"""
+        with self._lock:
+            futures = {(self._prefetched.pop(url, None) or self._submit(url)): (index, url)
+                       for index, url in enumerate(urls)}
+        for future in as_completed(futures):
+            index, url = futures[future]
+            try:
+                page = future.result()
+            except Exception as e:
+                logger.warning("Error parsing page %s: %s", url, e)
+                page = None
+            yield index, url, page
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+@lru_cache(maxsize=None)
+def html_parser():
+    """Prefer the lxml backend when it is installed"""
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+
+def _meta_content(soup, *selectors):
+    for attrs in selectors:
+        tag = soup.find('meta', attrs=attrs)
+        if tag and tag.get('content'):
+            return tag['content'].strip()
+    return None
+
+
+def parse_page(body, encoding=None):
+    """Extract the title and lead text from an HTML document
+
+    Without an encoding, BeautifulSoup detects it from the document's <meta charset> or bytes.
+    """
+    # bs4 is imported on first parse to keep it off the startup path
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(body, html_parser(), from_encoding=encoding)
+
+    title = _meta_content(soup, {'property': 'og:title'}, {'name': 'twitter:title'})
+    if not title and soup.title and soup.title.string:
+        title = soup.title.string.strip()
+    if not title:
+        heading = soup.find('h1')
+        title = heading.get_text(' ', strip=True) if heading else None
+
+    lead = _meta_content(soup, {'property': 'og:description'}, {'name': 'description'})
+    paragraphs = []
+    for paragraph in soup.find_all('p'):
+        text = paragraph.get_text(' ', strip=True)
+        if len(text) >= 40:  # Skip bylines, captions and navigation snippets
+            paragraphs.append(text)
+        if sum(len(p) for p in paragraphs) >= PAGE_LEAD_CHARS:
+            break
+    if paragraphs:
+        body_text = ' '.join(paragraphs)[:PAGE_LEAD_CHARS]
+        lead = f"{lead}\n{body_text}" if lead and lead not in body_text else body_text
+
+    return {'title': title, 'lead': lead}
@@ -0,0 +1,213 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import *
+from rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class PerplexityAPIError(Exception):
+    """Raised when Perplexity returns a non-success response after all retries"""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"Perplexity API returned {status_code}: {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+class PerplexityClient:
+    """Pooled keep-alive client for the Perplexity API with retries and latency tracking"""
+
+    def __init__(self, api_key, base_url=PERPLEXITY_API_BASE, timeout=PERPLEXITY_TIMEOUT,
+                 max_retries=PERPLEXITY_MAX_RETRIES, pool_size=PERPLEXITY_POOL_SIZE,
+                 max_rps=PERPLEXITY_MAX_RPS, cache=None, metrics=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.rate_limiter = RateLimiter(max_rps)
+        self.cache = cache
+        self.metrics = metrics
+
+        # One session shared by all worker threads keeps TCP+TLS connections alive
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        })
+
+        self._latencies = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def chat_completion(self, messages, model='sonar', stage='chat/completions', stream=PERPLEXITY_STREAMING,
+                        on_chunk=None, **params):
+        """Request a chat completion and return the decoded JSON response
+
+        With stream, the completion is read as server-sent events and assembled into the same
+        response shape. on_chunk(content, chunk) is called with the text so far as each event
+        arrives and may return True to cancel the rest of the generation. Cancelled responses
+        are marked with 'cancelled' and cached with that mark, so a repeated request gets the
+        same partial answer its caller already acted on. Responses served from the cache carry
+        the time their request was made as 'cached_at'.
+        """
+        payload = {'model': model, 'messages': messages}
+        payload.update(params)
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(payload)
+            cached = self.cache.get(key, stage)
+            if cached is not None:
+                if self.metrics is not None:
+                    self.metrics.record_cache_hit(stage)
+                return cached
+        requested_at = time.time()
+        if stream:
+            result = self.stream('/chat/completions', payload, stage=stage, on_chunk=on_chunk)
+        else:
+            result = self.post('/chat/completions', payload, stage=stage)
+        if key is not None:
+            self.cache.put(key, stage, result, created_at=requested_at)
+        return result
+
+    def post(self, path, payload, stage=None):
+        """POST a JSON payload, retrying 429/5xx responses and connection errors"""
+        return self._send(path, payload, stage, lambda response: response.json())
+
+    def stream(self, path, payload, stage=None, on_chunk=None):
+        """POST a streaming request and assemble its events into a regular response
+
+        Failures are retried as in post, including streams cut off part way, in which case
+        on_chunk sees the retried stream from its start.
+        """
+        stage = stage or path
+        return self._send(path, dict(payload, stream=True), stage,
+                          lambda response: self._read_events(response, stage, on_chunk), stream=True)
+
+    def _send(self, path, payload, stage, read, stream=False):
+        stage = stage or path
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            started = time.monotonic()
+            try:
+                response = self.session.post(self.base_url + path, json=payload, timeout=self.timeout, stream=stream)
+                if response.status_code == 200:
+                    result = read(response)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                self._record_latency(stage, time.monotonic() - started)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                logger.warning("Perplexity %s request failed (%s), retrying in %.1fs", stage, e, delay)
+            else:
+                self._record_latency(stage, time.monotonic() - started)
+                if response.status_code == 200:
+                    if self.metrics is not None:
+                        self.metrics.record_api_call(stage, result.get('usage'))
+                    return result
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    raise PerplexityAPIError(response.status_code, response.text)
+                delay = self._retry_after(response)
+                if delay is None:
+                    delay = self._backoff_delay(attempt)
+                # A server asking for a long wait must not block a worker thread for that long
+                delay = min(delay, PERPLEXITY_BACKOFF_MAX)
+                logger.warning("Perplexity %s request returned %s, retrying in %.1fs", stage, response.status_code, delay)
+            attempt += 1
+            time.sleep(delay)
+
+    def _read_events(self, response, stage, on_chunk):
+        """Assemble server-sent completion events, stopping early if on_chunk asks to"""
+        if 'text/event-stream' not in response.headers.get('Content-Type', ''):
+            return response.json()
+        started = time.monotonic()
+        result = {}
+        parts = []
+        finish_reason = None
+        try:
+            for line in response.iter_lines():
+                if not line.startswith(b'data:'):
+                    continue
+                data = line[5:].strip()
+                if data == b'[DONE]':
+                    break
+                chunk = json.loads(data)
+                if not parts and not result:
+                    self._record_latency(f'{stage}_first_event', time.monotonic() - started)
+                # Metadata such as search_results and usage is repeated or completed in later events
+                for field in ('id', 'model', 'created', 'usage', 'citations', 'search_results'):
+                    if field in chunk:
+                        result[field] = chunk[field]
+                choice = (chunk.get('choices') or [{}])[0]
+                delta = (choice.get('delta') or choice.get('message') or {}).get('content')
+                if delta:
+                    parts.append(delta)
+                finish_reason = choice.get('finish_reason') or finish_reason
+                if on_chunk is not None and on_chunk(''.join(parts), chunk):
+                    result['cancelled'] = True
+                    finish_reason = 'cancelled'
+                    break
+        finally:
+            # Closing the connection mid-stream stops the remaining generation
+            response.close()
+        result['choices'] = [{'index': 0, 'finish_reason': finish_reason,
+                              'message': {'role': 'assistant', 'content': ''.join(parts)}}]
+        return result
+
+    def _backoff_delay(self, attempt):
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(PERPLEXITY_BACKOFF_MAX, PERPLEXITY_BACKOFF_BASE * 2 ** attempt))
+
+    def _retry_after(self, response):
+        """Parse a Retry-After header given either in seconds or as an HTTP date"""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    def _record_latency(self, stage, seconds):
+        with self._lock:
+            self._latencies[stage].append(seconds)
+
+    def latency_stats(self):
+        """Return call count and latency percentiles (in seconds) for each endpoint"""
+        stats = {}
+        with self._lock:
+            latencies = {stage: sorted(values) for stage, values in self._latencies.items()}
+        for stage, values in latencies.items():
+            count = len(values)
+            stats[stage] = {
+                'count': count,
+                'mean': sum(values) / count,
+                'p50': values[int(0.50 * (count - 1))],
+                'p95': values[int(0.95 * (count - 1))],
+                'max': values[-1]
+            }
+        return stats
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,86 @@
+import logging
+import re
+
+from config import *
+
+logger = logging.getLogger(__name__)
+
+# Rough token estimate for English text; no tokenizer dependency is needed for budgeting
+CHARS_PER_TOKEN = 4
+
+_CITATION = re.compile(r'\s*\[\d+(?:\s*,\s*\d+)*\]')
+_MARKDOWN = re.compile(r'[*#`>]+')
+_WHITESPACE = re.compile(r'\s+')
+_SENTENCE_END = re.compile(r'[.!?]\s')
+
+
+def estimate_tokens(text):
+    """Approximate the number of tokens in text"""
+    return -(-len(text or '') // CHARS_PER_TOKEN)
+
+
+def condense(text):
+    """Strip citation markers, markdown and repeated whitespace from model output"""
+    text = _CITATION.sub('', text or '')
+    text = _MARKDOWN.sub('', text)
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def truncate(text, max_tokens):
+    """Cut text to about max_tokens, preferring to end on a sentence boundary"""
+    max_chars = max(0, max_tokens) * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    ends = [match.end() for match in _SENTENCE_END.finditer(cut)]
+    if ends and ends[-1] >= max_chars // 2:
+        return cut[:ends[-1]].rstrip()
+    return cut.rsplit(' ', 1)[0].rstrip() + '...'
+
+
+def domain_filter(sources=TRUSTED_SOURCES, limit=SEARCH_DOMAIN_FILTER_MAX):
+    """Return the search_domain_filter parameter for the trusted sources, or None if there are too many
+
+    Sending only some of the sources would restrict the search to those, so longer lists
+    are left to the local source filter instead.
+    """
+    if len(sources) > limit:
+        logger.info("%s trusted sources exceed Perplexity's limit of %s filter domains; "
+                    "filtering search results locally instead", len(sources), limit)
+        return None
+    return list(sources)
+
+
+class PromptBuilder:
+    """Builds chat messages that fit per-stage token budgets
+
+    Every prompt starts with the same system message, and only the content part is
+    condensed and truncated; instructions are always sent in full. The tokens saved
+    against the unbudgeted prompt are recorded in the run metrics.
+    """
+
+    def __init__(self, budgets=PROMPT_TOKEN_BUDGETS, system_prompt=SYSTEM_PROMPT, metrics=None):
+        self.budgets = budgets
+        self.system_prompt = system_prompt
+        self.metrics = metrics
+        self._system_tokens = estimate_tokens(system_prompt)
+
+    def messages(self, stage, instruction, content='', offloaded=''):
+        """Return messages for stage
+
+        offloaded is text that used to be part of the prompt and is now sent another way,
+        such as the trusted sources moved to search_domain_filter; it only counts as saved.
+        """
+        budget = self.budgets.get(stage, self.budgets['default'])
+        prompt = instruction
+        if content:
+            available = budget - self._system_tokens - estimate_tokens(instruction) - 1
+            prompt = f"{instruction} {truncate(condense(content), available)}"
+
+        sent = self._system_tokens + estimate_tokens(prompt)
+        baseline = estimate_tokens(' '.join(part for part in (instruction, offloaded, content) if part))
+        if sent > budget:
+            logger.debug("Prompt for %s is %s tokens, over its budget of %s", stage, sent, budget)
+        if self.metrics is not None:
+            self.metrics.record_prompt(stage, sent, baseline - sent)
+        return [{'role': 'system', 'content': self.system_prompt}, {'role': 'user', 'content': prompt}]
@@ -0,0 +1,29 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Thread-safe token bucket limiting calls to a fixed rate per second"""
+
+    def __init__(self, rate, burst=None):
+        # A rate of 0 or None disables limiting entirely
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1, int(rate or 1))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call is allowed under the configured rate"""
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,118 @@
+import re
+
+import numpy as np
+
+from config import *
+
+ACCEPT = 'accept'
+REJECT = 'reject'
+AMBIGUOUS = 'ambiguous'
+
+# Fixed feature weights, so a pair scores the same whatever else is in its batch
+WORD_WEIGHT = 3.0
+BIGRAM_WEIGHT = 3.0
+NGRAM_WEIGHT = 1.0
+STOPWORDS = frozenset('''
+    a about after again against all also an and any are as at be been before being between both but by
+    can could did do does during each few for from further had has have having he her here hers him his
+    how i if in into is it its itself just me more most my new no nor not now of off on once only or
+    other our out over own said same says she should so some such than that the their them then there
+    these they this those through to too under until up very was we were what when where which while
+    who whom why will with would you your
+'''.split())
+
+
+def string_hashes(strings, count):
+    """Hash count strings into a NumPy int64 array
+
+    Python's string hash is salted per process, which is fine because
+    the hashes are only ever compared within a single process.
+    """
+    return np.fromiter((hash(string) for string in strings), dtype=np.int64, count=count)
+
+
+class RelevanceFilter:
+    """Local n-gram pre-filter scoring candidate snippets against topics in one batch
+
+    Snippets and topics are turned into hashed word and character n-gram vectors with
+    fixed feature weights and compared with a cosine-similarity matrix, so a pair's score
+    does not depend on what else is scored with it. Candidates scoring at or above the
+    accept threshold are treated as relevant and those below the reject threshold are
+    dropped, so only the ambiguous middle band needs an LLM relevance check.
+    """
+
+    def __init__(self, accept_threshold=RELEVANCE_ACCEPT_THRESHOLD,
+                 reject_threshold=RELEVANCE_REJECT_THRESHOLD, dim=RELEVANCE_HASH_DIM,
+                 chunk_size=256):
+        if reject_threshold > accept_threshold:
+            raise ValueError("reject_threshold must not exceed accept_threshold")
+        self.accept_threshold = accept_threshold
+        self.reject_threshold = reject_threshold
+        # Power of two so hashed features can be bucketed with a bit mask
+        self.dim = 1 << (int(dim) - 1).bit_length()
+        self.chunk_size = chunk_size
+
+    def _features(self, text):
+        """Hash a text's features into bucket indices with their fixed weights
+
+        Features are word unigrams and bigrams and in-word character 3/4-grams; stopwords
+        are skipped. Whole words and bigrams carry more weight than character n-grams,
+        which only soften mismatches between inflections such as "rate" and "rates".
+        """
+        words = [word for word in re.findall(r'\w+', text.lower()) if word not in STOPWORDS]
+        features = list(words)
+        weights = [WORD_WEIGHT] * len(words)
+        features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+        weights.extend([BIGRAM_WEIGHT] * (len(features) - len(weights)))
+        for word in words:
+            padded = f" {word} "
+            for n in (3, 4):
+                features.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        weights.extend([NGRAM_WEIGHT] * (len(features) - len(weights)))
+        indices = string_hashes(features, len(features)) & (self.dim - 1)
+        return indices, np.array(weights, dtype=np.float32)
+
+    def _matrix(self, feature_rows):
+        counts = np.stack([np.bincount(indices, weights=weights, minlength=self.dim)
+                           for indices, weights in feature_rows]).astype(np.float32)
+        weighted = np.log1p(counts)
+        norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return weighted / norms
+
+    def score(self, texts, topics):
+        """Return a len(texts) x len(topics) matrix of cosine similarities
+
+        Each score depends only on its own text and topic, never on the rest of the batch.
+        """
+        scores = np.zeros((len(texts), len(topics)), dtype=np.float32)
+        if not texts or not topics:
+            return scores
+
+        topic_matrix = self._matrix([self._features(topic) for topic in topics])
+        # Build text vectors in chunks to bound memory for very large batches
+        for start in range(0, len(texts), self.chunk_size):
+            chunk = self._matrix([self._features(text) for text in texts[start:start + self.chunk_size]])
+            scores[start:start + len(chunk)] = chunk @ topic_matrix.T
+        return scores
+
+    def classify(self, candidates):
+        """Classify (text, topic) pairs, returning a list of (verdict, score) tuples"""
+        if not candidates:
+            return []
+        topics = list(dict.fromkeys(topic for _, topic in candidates))
+        column = {topic: i for i, topic in enumerate(topics)}
+        scores = self.score([text for text, _ in candidates], topics)
+        rows = np.arange(len(candidates))
+        columns = np.array([column[topic] for _, topic in candidates])
+        candidate_scores = scores[rows, columns]
+
+        verdicts = []
+        for value in candidate_scores.tolist():
+            if value >= self.accept_threshold:
+                verdicts.append((ACCEPT, value))
+            elif value < self.reject_threshold:
+                verdicts.append((REJECT, value))
+            else:
+                verdicts.append((AMBIGUOUS, value))
+        return verdicts
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from config import *
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """A named unit of work that runs either every interval seconds or daily at a fixed time"""
+
+    def __init__(self, name, func, interval=None, daily_at=None):
+        if (interval is None) == (daily_at is None):
+            raise ValueError("A job needs exactly one of interval or daily_at")
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.daily_at = daily_at
+        self.next_run = self.following(time.time())
+
+    def following(self, now):
+        """Return the first run time strictly after now"""
+        if self.interval is not None:
+            return now + self.interval
+        hour, minute = (int(part) for part in self.daily_at.split(':'))
+        current = datetime.fromtimestamp(now)
+        candidate = current.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate <= current:
+            candidate += timedelta(days=1)
+        return candidate.timestamp()
+
+
+class TopicScheduler:
+    """Dispatches the daily digest and faster per-topic refreshes from an asyncio event loop
+
+    Topics whose cadence in TOPIC_CADENCES is shorter than a day get a refresh job that
+    collects articles published since their last successful fetch; everything else is
+    fetched by the daily digest job. Instead of polling, the loop sleeps until the next
+    job is due. Jobs run on a single worker thread so pipeline runs never overlap.
+    """
+
+    def __init__(self, aggregator, digest_time=DIGEST_TIME, cadences=TOPIC_CADENCES):
+        self.aggregator = aggregator
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scheduler')
+        self.jobs = [Job('digest', aggregator.run_daily_digest, daily_at=digest_time)]
+
+        groups = {}
+        for topic in aggregator.subscribers.topics():
+            hours = cadences.get(topic, DEFAULT_TOPIC_CADENCE_HOURS)
+            if hours < 24:
+                groups.setdefault(hours, []).append(topic)
+        for hours, topics in sorted(groups.items()):
+            self.jobs.append(Job(f'refresh every {hours}h', lambda topics=topics: aggregator.refresh_topics(topics),
+                                 interval=hours * 60 * 60))
+            logger.info("Refreshing %s every %s hours", topics, hours)
+
+    async def _run(self, job):
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        try:
+            await loop.run_in_executor(self.executor, job.func)
+            logger.info("Job '%s' finished in %.1fs", job.name, time.monotonic() - started)
+        except Exception:
+            logger.exception("Job '%s' failed", job.name)
+
+    async def run_forever(self, run_immediately=True):
+        """Run jobs as they become due until cancelled"""
+        tasks = set()
+        running = set()
+
+        def dispatch(job):
+            if job.name in running:
+                logger.warning("Skipping job '%s' because the previous run is still in progress", job.name)
+                return
+            running.add(job.name)
+            task = asyncio.create_task(self._run(job))
+            tasks.add(task)
+            task.add_done_callback(lambda done, name=job.name: (tasks.discard(done), running.discard(name)))
+
+        if run_immediately:
+            dispatch(self.jobs[0])
+
+        while True:
+            now = time.time()
+            for job in self.jobs:
+                if job.next_run <= now:
+                    job.next_run = job.following(now)
+                    dispatch(job)
+            next_job = min(self.jobs, key=lambda job: job.next_run)
+            delay = max(0.0, next_job.next_run - time.time())
+            logger.debug("Next job '%s' in %.0fs", next_job.name, delay)
+            await asyncio.sleep(delay)
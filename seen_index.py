@@ -0,0 +1,87 @@
+import hashlib
+import logging
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from config import *
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+# Query parameters dropped from URLs: these exact names, and any name starting with utm_
+TRACKING_PARAMS = frozenset({'fbclid', 'gclid', 'mc_cid', 'mc_eid', 'ref', 'cmpid'})
+TRACKING_PREFIXES = ('utm_',)
+
+
+def _is_tracking(key):
+    key = key.lower()
+    return key in TRACKING_PARAMS or key.startswith(TRACKING_PREFIXES)
+
+
+def normalize_url(url):
+    """Canonicalize a URL so trivially different links to the same article compare equal"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking(key)
+    )
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit(('https' if parts.scheme in ('http', 'https') else parts.scheme,
+                       host, path, urlencode(query), ''))
+
+
+def url_hash(url):
+    """Return a signed 64-bit hash of the normalized URL, suitable as an SQLite integer key"""
+    digest = hashlib.sha1(normalize_url(url).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+
+class SeenArticleIndex(SQLiteStore):
+    """Persistent index of delivered article URLs with time-based expiry
+
+    Each URL is stored as a 64-bit hash of its normalized form in an SQLite table,
+    so the footprint stays at a few dozen bytes per article. The hash is the table's
+    integer primary key, so a lookup is a single B-tree probe and opening the index
+    costs the same with millions of entries as with none.
+    """
+
+    def __init__(self, path=SEEN_INDEX_FILE, ttl_days=SEEN_ARTICLE_TTL_DAYS):
+        self.ttl = ttl_days * 24 * 60 * 60
+        super().__init__(path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS seen_articles (
+                url_hash INTEGER PRIMARY KEY,
+                delivered_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS seen_articles_delivered ON seen_articles (delivered_at)')
+
+    def purge_expired(self):
+        """Delete entries older than the configured TTL"""
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM seen_articles WHERE delivered_at < ?',
+                                        (time.time() - self.ttl,))
+        if cursor.rowcount:
+            logger.debug("Purged %s expired entries from the seen-article index", cursor.rowcount)
+
+    def __contains__(self, url):
+        key = url_hash(url)
+        with self._lock:
+            row = self._conn.execute('SELECT delivered_at FROM seen_articles WHERE url_hash = ?',
+                                     (key,)).fetchone()
+        return row is not None and time.time() - row[0] <= self.ttl
+
+    def add_many(self, urls):
+        """Record URLs as delivered now"""
+        now = time.time()
+        keys = [url_hash(url) for url in urls]
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany('INSERT OR REPLACE INTO seen_articles (url_hash, delivered_at) VALUES (?, ?)',
+                                   [(key, now) for key in keys])
+            self._conn.execute('COMMIT')
+        # Expired entries are purged after a delivery rather than at startup
+        self.purge_expired()
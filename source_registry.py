@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+from urllib.parse import urlsplit
+
+from config import *
+
+logger = logging.getLogger(__name__)
+
+
+def hostname(url):
+    """Return the lowercase hostname of url without port, credentials or trailing dot, or None"""
+    try:
+        host = urlsplit(url.strip()).hostname
+    except (AttributeError, ValueError):
+        return None
+    return host.rstrip('.') if host else None
+
+
+def normalize_domain(domain):
+    """Turn a source entry such as 'https://www.Reuters.com/' or '.reuters.com' into 'www.reuters.com'"""
+    domain = domain.strip().lower()
+    if '//' in domain:
+        domain = hostname(domain) or ''
+    return domain.strip('.').split('/')[0]
+
+
+def _read_domains(path):
+    """Read a domain list file: one domain per line, or hosts-file lines like '0.0.0.0 example.com'"""
+    domains = []
+    with open(path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].split()
+            if line:
+                domains.append(line[-1])
+    return domains
+
+
+class SourceRegistry:
+    """Trusted and blocked news sources indexed by domain for constant-time URL checks
+
+    A URL matches a source when its hostname is the source domain or one of its subdomains,
+    so 'www.reuters.com' matches 'reuters.com' but 'evil-reuters.com' and
+    'reuters.com.example.net' do not. Matching walks the hostname's label suffixes through
+    hash lookups, so its cost depends on the number of labels, not on the number of sources.
+    """
+
+    def __init__(self, allow=TRUSTED_SOURCES, block=(), topics=None, weights=None):
+        # allow=None accepts every source that is not blocked; dicts keep the configured order
+        self._allow = None if allow is None else dict.fromkeys(normalize_domain(domain) for domain in allow)
+        self._block = {normalize_domain(domain) for domain in block}
+        self._topics = {topic: dict.fromkeys(normalize_domain(domain) for domain in domains)
+                        for topic, domains in (topics or {}).items()}
+        self._weights = {normalize_domain(domain): float(weight) for domain, weight in (weights or {}).items()}
+        self._domain_lists = {}
+
+    @classmethod
+    def load(cls, path=SOURCES_FILE):
+        """Load sources from a JSON file, falling back to TRUSTED_SOURCES
+
+        The file may hold "allow" and "block" lists, "topics" mapping a topic to extra
+        sources trusted for it, and "weights" mapping sources to ranking weights (default 1).
+        "allow" may also map sources to weights directly. Any list can instead be the path
+        of a text file with one domain per line, which suits blocklists of many thousands.
+        """
+        if not path or not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            config = json.load(f)
+        base = os.path.dirname(path)
+
+        def domains(value):
+            if isinstance(value, str):
+                return _read_domains(os.path.join(base, value))
+            return list(value)
+
+        allow = config.get('allow', TRUSTED_SOURCES)
+        weights = dict(config.get('weights', {}))
+        if isinstance(allow, dict):
+            weights = {**allow, **weights}
+        registry = cls(
+            allow=None if allow is None else domains(allow),
+            block=domains(config.get('block', [])),
+            topics={topic: domains(value) for topic, value in config.get('topics', {}).items()},
+            weights=weights
+        )
+        logger.info("Loaded sources from %s: %s allowed, %s blocked, %s topic allowlists", path,
+                    'all' if registry._allow is None else len(registry._allow), len(registry._block),
+                    len(registry._topics))
+        return registry
+
+    @staticmethod
+    def _match(host, domains):
+        """Return the most specific domain in domains that host equals or is a subdomain of"""
+        labels = host.split('.')
+        for i in range(len(labels)):
+            suffix = '.'.join(labels[i:])
+            if suffix in domains:
+                return suffix
+        return None
+
+    def source(self, url, topic=None):
+        """Return the allowed source domain url belongs to, '' if any source is allowed, or None if rejected"""
+        host = hostname(url)
+        if not host or self._match(host, self._block) is not None:
+            return None
+        if topic in self._topics:
+            matched = self._match(host, self._topics[topic])
+            if matched is not None:
+                return matched
+        if self._allow is None:
+            return self._match(host, self._weights) or ''
+        return self._match(host, self._allow)
+
+    def allows(self, url, topic=None):
+        return self.source(url, topic) is not None
+
+    def weight(self, url, topic=None):
+        """Ranking weight of the source url belongs to, or 0 if it is not allowed"""
+        source = self.source(url, topic)
+        if source is None:
+            return 0.0
+        return self._weights.get(source, 1.0)
+
+    def filter_urls(self, results, topic=None):
+        """Keep the allowed items of a search_results batch, ranked by source weight
+
+        Items are URLs or dicts with a 'url' key. Items of equal weight keep their order.
+        """
+        ranked = []
+        for result in results:
+            url = result.get('url') if isinstance(result, dict) else result
+            source = self.source(url, topic) if url else None
+            if source is not None:
+                ranked.append((-self._weights.get(source, 1.0), len(ranked), result))
+        ranked.sort(key=lambda item: item[:2])
+        return [result for _, _, result in ranked]
+
+    def has_allowlist(self, topic):
+        return topic in self._topics
+
+    def domains(self, topic=None):
+        """Allowed domains for topic, highest weight first, or None if every source is allowed"""
+        if self._allow is None:
+            return None
+        if topic not in self._domain_lists:
+            domains = {**self._allow, **self._topics.get(topic, {})}
+            self._domain_lists[topic] = sorted(domains, key=lambda domain: -self._weights.get(domain, 1.0))
+        return self._domain_lists[topic]
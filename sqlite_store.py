@@ -0,0 +1,24 @@
+import os
+import sqlite3
+import threading
+
+
+class SQLiteStore:
+    """Base for the SQLite-backed stores: one connection shared by the threads of a process
+
+    The connection is in autocommit mode with write-ahead logging, so readers are not
+    blocked by a writer in another process. Subclasses serialize access with self._lock.
+    timeout is how long a write waits for another process's lock before failing.
+    """
+
+    def __init__(self, path, timeout=5.0):
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
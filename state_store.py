@@ -0,0 +1,203 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from config import *
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+
+def new_run_id():
+    """Return a sortable, unique id for a digest run"""
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+class StateStore(SQLiteStore):
+    """SQLite-backed run state: per-topic fetch watermarks and search latencies, articles
+    awaiting delivery and per-run stage checkpoints"""
+
+    def __init__(self, path=STATE_FILE):
+        super().__init__(path)
+        # Checkpoints must survive a crash or power loss right after they are written
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS topic_watermarks (
+                topic TEXT PRIMARY KEY,
+                last_success REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS topic_latencies (
+                topic TEXT PRIMARY KEY,
+                seconds REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pending_articles (
+                id INTEGER PRIMARY KEY,
+                topic TEXT NOT NULL,
+                url TEXT NOT NULL UNIQUE,
+                article TEXT NOT NULL,
+                collected_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                started_at REAL NOT NULL,
+                completed_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                run_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                output TEXT NOT NULL,
+                saved_at REAL NOT NULL,
+                PRIMARY KEY (run_id, key, stage)
+            );
+        """)
+
+    def watermark(self, topic):
+        """Return the start time of the last successful fetch for topic, or None"""
+        with self._lock:
+            row = self._conn.execute('SELECT last_success FROM topic_watermarks WHERE topic = ?',
+                                     (topic,)).fetchone()
+        return row[0] if row else None
+
+    def set_watermarks(self, watermarks):
+        """Record successful fetch start times from a {topic: timestamp} mapping"""
+        if not watermarks:
+            return
+        with self._lock:
+            self._conn.execute('BEGIN')
+            # Never move a watermark backwards if an older run finishes last
+            self._conn.executemany(
+                'INSERT INTO topic_watermarks (topic, last_success) VALUES (?, ?) '
+                'ON CONFLICT(topic) DO UPDATE SET last_success = MAX(last_success, excluded.last_success)',
+                list(watermarks.items())
+            )
+            self._conn.execute('COMMIT')
+
+    def record_latencies(self, latencies, weight=TOPIC_LATENCY_WEIGHT):
+        """Fold {topic: seconds} search durations into each topic's moving average latency"""
+        if not latencies:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                'INSERT INTO topic_latencies (topic, seconds, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(topic) DO UPDATE SET seconds = seconds + ? * (excluded.seconds - seconds), '
+                'updated_at = excluded.updated_at',
+                [(topic, seconds, now, weight) for topic, seconds in latencies.items()]
+            )
+            self._conn.execute('COMMIT')
+
+    def latencies(self):
+        """Return {topic: moving average search seconds} for every topic searched before"""
+        with self._lock:
+            rows = self._conn.execute('SELECT topic, seconds FROM topic_latencies').fetchall()
+        return dict(rows)
+
+    def add_pending(self, articles):
+        """Hold articles collected between digests until they are delivered"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO pending_articles (topic, url, article, collected_at) VALUES (?, ?, ?, ?)',
+                [(article['topic'], article['url'], json.dumps(article), now) for article in articles]
+            )
+            self._conn.execute('COMMIT')
+
+    def pending_articles(self):
+        """Return (ids, articles) for every article awaiting delivery, oldest first"""
+        with self._lock:
+            rows = self._conn.execute('SELECT id, article FROM pending_articles ORDER BY id').fetchall()
+        return [row[0] for row in rows], [json.loads(row[1]) for row in rows]
+
+    def clear_pending(self, ids):
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany('DELETE FROM pending_articles WHERE id = ?', [(i,) for i in ids])
+            self._conn.execute('COMMIT')
+
+    def begin_run(self, run_id=None, resume_within=CHECKPOINT_RESUME_HOURS * 60 * 60):
+        """Start or resume a run, returning (run_id, resumed)
+
+        Without an explicit run_id the most recent incomplete run started within
+        resume_within seconds is resumed, so retrying after a crash picks up where it stopped.
+        Incomplete runs older than that are abandoned and their checkpoints deleted, unless
+        run_id names one of them.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            stale = ('FROM runs WHERE completed_at IS NULL AND started_at < ? AND run_id IS NOT ?',
+                     (now - resume_within, run_id))
+            self._conn.execute(f'DELETE FROM checkpoints WHERE run_id IN (SELECT run_id {stale[0]})', stale[1])
+            cursor = self._conn.execute(f'DELETE {stale[0]}', stale[1])
+            self._conn.execute('COMMIT')
+            if cursor.rowcount:
+                logger.warning("Abandoned %s incomplete runs older than %.0f hours", cursor.rowcount,
+                               resume_within / 3600)
+            if run_id is None:
+                row = self._conn.execute(
+                    'SELECT run_id FROM runs WHERE completed_at IS NULL AND started_at >= ? '
+                    'ORDER BY started_at DESC LIMIT 1', (now - resume_within,)
+                ).fetchone()
+                if row:
+                    return row[0], True
+                run_id = new_run_id()
+            cursor = self._conn.execute('INSERT OR IGNORE INTO runs (run_id, started_at) VALUES (?, ?)',
+                                        (run_id, now))
+            return run_id, cursor.rowcount == 0
+
+    def complete_run(self, run_id, retention_days=CHECKPOINT_RETENTION_DAYS):
+        """Mark a run complete and drop checkpoints of completed runs past the retention period"""
+        now = time.time()
+        cutoff = now - retention_days * 24 * 60 * 60
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.execute('UPDATE runs SET completed_at = ? WHERE run_id = ?', (now, run_id))
+            self._conn.execute('DELETE FROM checkpoints WHERE run_id IN '
+                               '(SELECT run_id FROM runs WHERE completed_at IS NOT NULL AND started_at < ?)',
+                               (cutoff,))
+            self._conn.execute('DELETE FROM runs WHERE completed_at IS NOT NULL AND started_at < ?', (cutoff,))
+            self._conn.execute('COMMIT')
+
+    def checkpoints(self, run_id):
+        """Return {(key, stage): output} for every checkpoint saved by a run"""
+        with self._lock:
+            rows = self._conn.execute('SELECT key, stage, output FROM checkpoints WHERE run_id = ?',
+                                      (run_id,)).fetchall()
+        return {(key, stage): json.loads(output) for key, stage, output in rows}
+
+    def save_checkpoint(self, run_id, key, stage, output):
+        """Persist one stage output; each write is a single atomic SQLite transaction"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO checkpoints (run_id, key, stage, output, saved_at) VALUES (?, ?, ?, ?, ?)',
+                (run_id, key, stage, json.dumps(output), time.time())
+            )
+
+
+class RunCheckpoint:
+    """Stage outputs of a single run, loaded once and written through to the StateStore"""
+
+    def __init__(self, store, run_id):
+        self.store = store
+        self.run_id = run_id
+        self._outputs = store.checkpoints(run_id)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._outputs)
+
+    def get(self, key, stage):
+        with self._lock:
+            return self._outputs.get((key, stage))
+
+    def save(self, key, stage, output):
+        self.store.save_checkpoint(self.run_id, key, stage, output)
+        with self._lock:
+            self._outputs[(key, stage)] = output
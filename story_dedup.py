@@ -0,0 +1,102 @@
+import string
+import threading
+
+import numpy as np
+
+from config import *
+from relevance_filter import string_hashes
+
+SIGNATURE_BITS = 64
+# Punctuation is turned into spaces with str.translate, which is much faster than a regex tokenizer
+_PUNCTUATION = str.maketrans({char: ' ' for char in string.punctuation + '\u2018\u2019\u201c\u201d\u2013\u2014\u2026\u00ab\u00bb'})
+# Odd multipliers that mix the hashes of a shingle's three words into one 64-bit value
+_MIXERS = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F), np.uint64(0x165667B19E3779F9))
+
+
+def signature(text, min_words=DEDUP_MIN_WORDS):
+    """64-bit SimHash of the word 3-shingles in text, or None if text is too short to compare"""
+    words = (text or '').lower().translate(_PUNCTUATION).split()
+    if len(words) < min_words:
+        return None
+    hashes = string_hashes(words, len(words)).view(np.uint64)
+    shingles = hashes[:-2] * _MIXERS[0] ^ hashes[1:-1] * _MIXERS[1] ^ hashes[2:] * _MIXERS[2]
+    shingles ^= shingles >> np.uint64(29)
+    bits = np.unpackbits(shingles.view(np.uint8)).reshape(-1, SIGNATURE_BITS)
+    # Each bit of the signature is set when most shingles have it set
+    votes = np.ones(len(shingles), dtype=np.float32) @ bits.astype(np.float32)
+    return int(np.packbits(2 * votes > len(shingles)).view(np.uint64)[0])
+
+
+class StoryIndex:
+    """Thread-safe LSH index over SimHash signatures that clusters near-duplicate stories
+
+    Signatures are split into max_distance + 1 bands. Two signatures within max_distance
+    bits of each other must agree on at least one whole band, so only stories sharing a
+    band bucket are compared. Each cluster is represented by its story with the lowest
+    rank, so concurrent callers get the same clusters whatever order they add stories in;
+    stories added without a rank rank after every ranked story, in the order they are added.
+    """
+
+    def __init__(self, max_distance=DEDUP_MAX_DISTANCE):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        width = SIGNATURE_BITS // bands
+        self._bands = [(i * width, (1 << width) - 1) for i in range(bands)]
+        self._buckets = [{} for _ in self._bands]
+        # Every URL added, mapped to the cluster it belongs to
+        self._urls = {}
+        self._clusters = []
+        self._added = 0
+        self._lock = threading.Lock()
+
+    def add(self, text, url, topic, rank=None):
+        """Add a story, returning the URL of the story it duplicates, or None if it represents its cluster
+
+        rank is a sortable tuple such as (topic index, result index). A story that ranks
+        before its cluster's representative takes its place, and None is returned for it.
+        """
+        sig = signature(text)
+        keys = [(sig >> shift) & mask for shift, mask in self._bands] if sig is not None else []
+        with self._lock:
+            self._added += 1
+            rank = tuple(rank) if rank is not None else (float('inf'), self._added)
+            cluster = self._urls.get(url)
+            if cluster is None:
+                cluster = self._find(sig, keys)
+            if cluster is None:
+                # Texts too short to sign are still matched by URL
+                cluster = {'url': url, 'topic': topic, 'rank': rank, 'sig': sig, 'members': []}
+                self._clusters.append(cluster)
+                self._urls[url] = cluster
+                for buckets, key in zip(self._buckets, keys):
+                    buckets.setdefault(key, []).append(cluster)
+                return None
+            self._urls.setdefault(url, cluster)
+            if (cluster['url'], cluster['topic']) == (url, topic):
+                return None  # Already added as the representative
+            if rank < cluster['rank']:
+                cluster['members'].append((cluster['rank'], cluster['url'], cluster['topic']))
+                cluster['members'] = [member for member in cluster['members'] if member[1:] != (url, topic)]
+                cluster.update(url=url, topic=topic, rank=rank)
+                return None
+            if not any(member[1:] == (url, topic) for member in cluster['members']):
+                cluster['members'].append((rank, url, topic))
+            return cluster['url']
+
+    def _find(self, sig, keys):
+        """Return the first cluster whose signature is within max_distance bits of sig"""
+        for buckets, key in zip(self._buckets, keys):
+            for cluster in buckets.get(key, ()):
+                # bin().count rather than int.bit_count, which needs Python 3.10
+                if bin(sig ^ cluster['sig']).count('1') <= self.max_distance:
+                    return cluster
+        return None
+
+    def clusters(self):
+        """Return {representative_url: [(url, topic), ...]} for every story that had duplicates, in rank order"""
+        with self._lock:
+            return {cluster['url']: [(url, topic) for _, url, topic in sorted(cluster['members'])]
+                    for cluster in self._clusters if cluster['members']}
+
+    def __len__(self):
+        return len(self._clusters)
@@ -0,0 +1,39 @@
+import re
+
+_SCORE = re.compile(r'"relevance_score"\s*:\s*(-?\d+(?:\.\d+)?)\s*[,}\n]')
+_IS_RELEVANT = re.compile(r'"is_relevant"\s*:\s*(true|false)')
+
+
+def relevance_verdict(content, threshold=0.6):
+    """Resolve a relevance verdict from a partial JSON analysis, or None while it is undecided
+
+    An article is relevant if its score is above threshold or the analysis says it is, so a
+    high score or a true is_relevant decides on its own; otherwise both fields are needed.
+    """
+    score = _SCORE.search(content)
+    is_relevant = _IS_RELEVANT.search(content)
+    if score is not None and float(score.group(1)) > threshold:
+        return True
+    if is_relevant is not None and is_relevant.group(1) == 'true':
+        return True
+    if score is not None and is_relevant is not None:
+        return False
+    return None
+
+
+class SearchStream:
+    """on_chunk callback for a streaming search that hands its results over on arrival
+
+    Perplexity sends search_results with the first events, long before the answer text is
+    complete, so on_results can start downstream work such as page fetches straight away.
+    """
+
+    def __init__(self, on_results):
+        self.on_results = on_results
+        self.results = None
+
+    def __call__(self, content, chunk):
+        if self.results is None and chunk.get('search_results'):
+            self.results = chunk['search_results']
+            self.on_results(self.results)
+        return False
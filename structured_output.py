@@ -0,0 +1,119 @@
+import json
+import re
+
+from config import *
+
+# JSON schema sent as the response_format so Perplexity returns one payload per request
+ARTICLE_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'articles': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'topic': {'type': 'string'},
+                    'title': {'type': 'string'},
+                    'url': {'type': 'string'},
+                    'summary': {'type': 'string'},
+                    'relevance_score': {'type': 'number'},
+                    'key_themes': {'type': 'array', 'items': {'type': 'string'}}
+                },
+                'required': ['topic', 'title', 'url', 'summary', 'relevance_score', 'key_themes']
+            }
+        }
+    },
+    'required': ['articles']
+}
+
+ARTICLE_FIELD_TYPES = {
+    'topic': str,
+    'title': str,
+    'url': str,
+    'summary': str,
+    'relevance_score': (int, float),
+    'key_themes': list
+}
+
+
+class StructuredOutputError(ValueError):
+    """Raised when a structured Perplexity response does not match ARTICLE_SCHEMA"""
+
+
+def build_structured_query(topics, hours=NEWS_TIME_WINDOW):
+    """Build a single prompt asking for verified, summarized articles for each topic"""
+    topic_list = '\n'.join(f"- {topic}" for topic in topics)
+    return (
+        f"Find recent news articles from the last {hours} hours.\n"
+        f"Return up to {MAX_ARTICLES_PER_TOPIC} articles for each of these topics:\n{topic_list}\n"
+        "For each article give the topic it belongs to (exactly as written above), its title, its URL, "
+        "a 2-3 sentence summary, a relevance_score between 0 and 1 for how relevant it is to the topic, "
+        "and a list of key_themes. Respond only with JSON matching the requested schema."
+    )
+
+
+def response_format():
+    """Return the response_format request parameter for structured output"""
+    return {'type': 'json_schema', 'json_schema': {'schema': ARTICLE_SCHEMA}}
+
+
+def _extract_json(content):
+    # Models occasionally wrap JSON in a markdown code fence despite the schema
+    fenced = re.search(r'```(?:json)?\s*(.*?)```', content, re.DOTALL)
+    if fenced:
+        content = fenced.group(1)
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError as e:
+        raise StructuredOutputError(f"Response is not valid JSON: {e}")
+
+
+def _validate_article(article):
+    if not isinstance(article, dict):
+        raise StructuredOutputError(f"Article is not an object: {article!r}")
+    for field, expected in ARTICLE_FIELD_TYPES.items():
+        if field not in article:
+            raise StructuredOutputError(f"Article is missing '{field}'")
+        value = article[field]
+        if not isinstance(value, expected) or isinstance(value, bool):
+            raise StructuredOutputError(f"Article field '{field}' has invalid value {value!r}")
+    if not all(isinstance(theme, str) for theme in article['key_themes']):
+        raise StructuredOutputError("Article key_themes must be a list of strings")
+    if not 0 <= article['relevance_score'] <= 1:
+        raise StructuredOutputError(f"Relevance score {article['relevance_score']} is outside 0-1")
+    if not re.match(r'https?://', article['url']):
+        raise StructuredOutputError(f"Article URL {article['url']!r} is not an http(s) URL")
+
+
+def parse_structured_response(response, topics):
+    """Validate a structured response and return relevant articles grouped by topic"""
+    try:
+        content = response['choices'][0]['message']['content']
+    except (KeyError, IndexError, TypeError):
+        raise StructuredOutputError("Response has no message content")
+
+    payload = _extract_json(content)
+    if not isinstance(payload, dict) or not isinstance(payload.get('articles'), list):
+        raise StructuredOutputError("Response does not contain an 'articles' list")
+
+    # Match topics case-insensitively since models tend to normalize capitalization
+    topic_lookup = {topic.lower().strip(): topic for topic in topics}
+    articles_by_topic = {topic: [] for topic in topics}
+    for article in payload['articles']:
+        _validate_article(article)
+        topic = topic_lookup.get(article['topic'].lower().strip())
+        if topic is None:
+            raise StructuredOutputError(f"Article topic {article['topic']!r} was not requested")
+        if article['relevance_score'] <= STRUCTURED_RELEVANCE_THRESHOLD:
+            continue
+        if len(articles_by_topic[topic]) >= MAX_ARTICLES_PER_TOPIC:
+            continue
+        articles_by_topic[topic].append({
+            'title': article['title'].strip(),
+            'url': article['url'].strip(),
+            'summary': article['summary'].strip(),
+            'topic': topic,
+            'relevance_score': article['relevance_score'],
+            'key_themes': article['key_themes']
+        })
+    return articles_by_topic
@@ -0,0 +1,57 @@
+import json
+import logging
+import os
+
+from config import *
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """A digest recipient and the topics they follow"""
+
+    def __init__(self, email, topics, name=None):
+        self.email = email
+        self.topics = list(topics)
+        self.name = name
+
+    def __repr__(self):
+        return f"Subscriber({self.email!r}, topics={self.topics!r})"
+
+
+class SubscriberRegistry:
+    """Collection of subscribers, each with their own topic set"""
+
+    def __init__(self, subscribers):
+        self.subscribers = list(subscribers)
+
+    @classmethod
+    def load(cls, path=SUBSCRIBERS_FILE):
+        """Load subscribers from a JSON file, falling back to EMAIL_RECIPIENT and DEFAULT_TOPICS
+
+        The file holds a list of objects such as
+        {"email": "reader@example.com", "name": "Reader", "topics": ["crypto", "startup funding"]}.
+        Subscribers without "topics" follow DEFAULT_TOPICS.
+        """
+        if path and os.path.exists(path):
+            with open(path) as f:
+                entries = json.load(f)
+            subscribers = []
+            for entry in entries:
+                if not entry.get('email'):
+                    raise ValueError(f"Subscriber entry in {path} has no email: {entry!r}")
+                subscribers.append(Subscriber(entry['email'], entry.get('topics') or DEFAULT_TOPICS,
+                                              entry.get('name')))
+            logger.info("Loaded %s subscribers from %s", len(subscribers), path)
+            return cls(subscribers)
+        return cls([Subscriber(EMAIL_RECIPIENT, DEFAULT_TOPICS)] if EMAIL_RECIPIENT else [])
+
+    def topics(self):
+        """Return the unique topics across all subscribers, in first-seen order"""
+        return list(dict.fromkeys(topic for subscriber in self.subscribers for topic in subscriber.topics))
+
+    def __iter__(self):
+        return iter(self.subscribers)
+
+    def __len__(self):
+        return len(self.subscribers)
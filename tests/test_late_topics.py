@@ -0,0 +1,95 @@
+"""Deadline delivery: a late topic's subscribers get its stories even when an on-time topic found them first
+
+Run from the project root with python -m unittest discover tests
+"""
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+# config.py reads the environment at import time
+_DATA_DIR = tempfile.mkdtemp(prefix='newsletter-test-')
+os.environ.update({
+    'NEWS_DATA_DIR': _DATA_DIR,
+    'SOURCES_FILE': '',
+    'SUBSCRIBERS_FILE': '',
+    'METRICS_FILE': '',
+    'PERPLEXITY_API_KEY': 'test-key',
+    'CACHE_ENABLED': 'false',
+    'PAGE_FETCH_ENABLED': 'false',
+    'RELEVANCE_PREFILTER_ENABLED': 'false',
+    'CHECKPOINT_ENABLED': 'false',
+    'DIGEST_DEADLINE_SECONDS': '0.5',
+    'LATE_TOPIC_POLICY': 'follow_up',
+})
+
+import news_aggregator
+from subscribers import Subscriber, SubscriberRegistry
+
+STORY = ('Bitcoin and ether rallied sharply as regulators approved new spot exchange '
+         'traded funds for crypto assets on Tuesday')
+
+
+class FakePerplexity:
+    """Answers every stage without network access; searches for slow topics take a while"""
+
+    def __init__(self, slow_topics=()):
+        self.slow_topics = set(slow_topics)
+
+    def chat_completion(self, messages, stage, **kwargs):
+        if stage == 'search':
+            topic = messages[-1]['content'].split(' about ')[-1].rstrip('.')
+            if topic in self.slow_topics:
+                time.sleep(1.0)
+            return {'choices': [{'message': {'content': f'Title: {STORY}\n{STORY}'}}],
+                    'search_results': [{'url': f'https://www.reuters.com/{topic}-story',
+                                        'title': STORY, 'snippet': STORY}]}
+        if stage == 'relevance':
+            return {'choices': [{'message': {'content': '{"relevance_score": 0.9, "is_relevant": true}'}}]}
+        return {'choices': [{'message': {'content': 'A summary.'}}]}
+
+    def latency_stats(self):
+        return {}
+
+
+class RecordingAggregator(news_aggregator.NewsAggregator):
+    """Collects (recipient, urls) for every email instead of sending it"""
+
+    def __init__(self, subscribers, slow_topics=()):
+        super().__init__(gmail_service=object(), subscribers=SubscriberRegistry(subscribers))
+        self.perplexity = FakePerplexity(slow_topics)
+        self.sent = []
+        self._sent_lock = threading.Lock()
+
+    def _send_messages(self, messages):
+        with self._sent_lock:
+            self.sent.append({message['to']: message['urls'] for message in messages})
+        return [True] * len(messages)
+
+
+class LateTopicFollowUpTest(unittest.TestCase):
+
+    def test_late_duplicate_reaches_late_topic_subscriber(self):
+        aggregator = RecordingAggregator(
+            [Subscriber('a@example.com', ['crypto']), Subscriber('b@example.com', ['bitcoin'])],
+            slow_topics=['bitcoin']
+        )
+        aggregator.run_daily_digest()
+
+        main, follow_up = aggregator.sent
+        self.assertEqual(list(main), ['a@example.com'])
+        self.assertEqual(list(follow_up), ['b@example.com'])
+        self.assertIn('https://www.reuters.com/crypto-story', follow_up['b@example.com'])
+        self.assertIsNotNone(aggregator.state.watermark('bitcoin'))
+
+    def test_story_already_received_is_not_sent_again(self):
+        # Tests share the data directory, so each uses its own topics and therefore URLs
+        aggregator = RecordingAggregator([Subscriber('a@example.com', ['ether', 'etfs'])], slow_topics=['etfs'])
+        aggregator.run_daily_digest()
+
+        self.assertEqual(aggregator.sent, [{'a@example.com': ['https://www.reuters.com/ether-story']}])
+
+
+if __name__ == '__main__':
+    unittest.main()
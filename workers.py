@@ -0,0 +1,160 @@
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from config import *
+from rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Stages whose results hold a topic's finished articles
+FINAL_STAGES = ('articles', 'structured')
+
+
+class Worker:
+    """Claims jobs from a JobQueue and runs them through a NewsAggregator's pipeline stages
+
+    A search job fetches one topic and enqueues an articles job for it, which verifies
+    and summarizes the results. Structured jobs cover a batch of topics in one request.
+    """
+
+    def __init__(self, aggregator, queue, threads=None):
+        self.aggregator = aggregator
+        self.queue = queue
+        self.threads = threads or aggregator.max_concurrent_topics
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    def run(self, run_id=None, exit_when_idle=False):
+        """Process jobs on several threads; with exit_when_idle, return once no job is left unfinished"""
+        logger.info("Worker %s processing jobs with %s threads", self.owner, self.threads)
+        threads = [threading.Thread(target=self._loop, args=(run_id, exit_when_idle), name=f'worker-{i}')
+                   for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _loop(self, run_id, exit_when_idle):
+        while True:
+            job = self.queue.claim(self.owner, run_id)
+            if job is None:
+                # Jobs leased by a worker that died are claimable again once their lease expires
+                if exit_when_idle and (run_id is None or not self.queue.unfinished(run_id)):
+                    return
+                time.sleep(JOB_POLL_SECONDS)
+                continue
+            self.process(job)
+
+    def process(self, job):
+        """Run one job and record its result, or release it for another attempt"""
+        logger.debug("Running %s job for %s (attempt %s)", job['stage'], job['key'], job['attempts'])
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, done), name=f"lease-{job['id']}", daemon=True)
+        heartbeat.start()
+        try:
+            result, follow_up = self._run_stage(job['stage'], job['key'], job['payload'])
+        except Exception as e:
+            logger.warning("%s job for %s failed: %s", job['stage'], job['key'], e)
+            self.queue.fail(job, self.owner, e)
+            return
+        finally:
+            done.set()
+            heartbeat.join()
+        self.queue.complete(job, self.owner, result, follow_up)
+
+    def _heartbeat(self, job, done):
+        """Keep renewing the lease on a running job so slow jobs are not claimed by another worker"""
+        interval = self.queue.lease_seconds / 3
+        while not done.wait(interval):
+            try:
+                if not self.queue.extend_lease(job, self.owner):
+                    logger.warning("Lost the lease on job %s (%s %s)", job['id'], job['stage'], job['key'])
+                    return
+            except Exception as e:
+                # A failed renewal is retried on the next beat, well before the lease expires
+                logger.warning("Error renewing the lease on job %s: %s", job['id'], e)
+
+    def _run_stage(self, stage, key, payload):
+        aggregator = self.aggregator
+        if stage == 'search':
+            response = aggregator._fetch_topic(key)
+            if response is None:
+                raise RuntimeError("search request failed")
+            started = aggregator._fetched_at.pop(key, time.time())
+            return {'started': started}, [(key, 'articles', {'started': started, 'response': response})]
+        if stage == 'articles':
+            articles = aggregator._extract_articles(payload['response'], key)
+            return {'fetched_at': {key: payload['started']}, 'articles': articles}, []
+        if stage == 'structured':
+            topics = payload['topics']
+            articles = [article for topic_articles in aggregator._search_structured(topics)
+                        for article in topic_articles]
+            fetched_at = {topic: aggregator._fetched_at.pop(topic) for topic in topics
+                          if topic in aggregator._fetched_at}
+            return {'fetched_at': fetched_at, 'articles': articles}, []
+        raise ValueError(f"Unknown job stage {stage!r}")
+
+
+class Coordinator:
+    """Runs a digest by fanning its topics out as jobs to local and remote worker processes
+
+    The coordinator enqueues the jobs, starts its local worker processes and then works
+    through the queue itself until every job has finished, so a run also completes when no
+    other worker is attached. Results are collected and delivered by the aggregator.
+    """
+
+    def __init__(self, aggregator, queue, workers=0):
+        self.aggregator = aggregator
+        self.queue = queue
+        self.workers = max(0, workers)
+
+    def run(self, run_id=None):
+        """Run one digest through the job queue"""
+        self.aggregator.run_daily_digest(run_id, search=self.search)
+        self.queue.prune()
+
+    def search(self, topics, run_id):
+        """Collect the articles for topics from queue jobs, in topic order"""
+        if self.aggregator.pipeline_mode == 'structured':
+            size = max(1, STRUCTURED_BATCH_SIZE)
+            jobs = [(f'batch-{i // size}', 'structured', {'topics': topics[i:i + size]})
+                    for i in range(0, len(topics), size)]
+        else:
+            jobs = [(topic, 'search', {}) for topic in topics]
+        self.queue.enqueue(run_id, jobs)
+        logger.info("Queued %s jobs for run %s", len(jobs), run_id)
+
+        processes = self._start_workers(run_id)
+        Worker(self.aggregator, self.queue).run(run_id, exit_when_idle=True)
+        for process in processes:
+            process.wait()
+
+        counts = self.queue.counts(run_id)
+        logger.info("Run %s jobs: %s", run_id, counts)
+        order = {topic: index for index, topic in enumerate(topics)}
+        articles = []
+        for key, stage, result in self.queue.results(run_id, FINAL_STAGES):
+            self.aggregator._fetched_at.update(result['fetched_at'])
+            articles.extend(result['articles'])
+        articles.sort(key=lambda article: order.get(article['topic'], len(order)))
+        # Workers summarize their topics independently, so duplicates across jobs are collapsed here
+        return self.aggregator.collapse_duplicates(articles)
+
+    def _start_workers(self, run_id):
+        """Start local worker processes, splitting the Perplexity rate limit between them"""
+        if not self.workers:
+            return []
+        env = dict(os.environ)
+        if PERPLEXITY_MAX_RPS:
+            share = PERPLEXITY_MAX_RPS / (self.workers + 1)
+            env['PERPLEXITY_MAX_RPS'] = str(share)
+            self.aggregator.perplexity.rate_limiter = RateLimiter(share)
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'news_aggregator.py')
+        command = [sys.executable, script, '--worker', '--run-id', run_id, '--exit-when-idle']
+        logger.info("Starting %s local workers", self.workers)
+        return [subprocess.Popen(command, env=env) for _ in range(self.workers)]